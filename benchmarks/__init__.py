@@ -0,0 +1,2 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
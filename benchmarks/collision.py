@@ -0,0 +1,95 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+'''
+Collision checking throughput against obstacle count, with fixed seeds.
+Maps grow with the number of obstacles, so that their density is kept.
+'''
+
+import numpy as np
+from dubins.environment import Environment
+
+def environment(n, seed=0):
+
+    # map scaled to hold n obstacles at the default density
+    k = max(np.sqrt(n/20), 1)
+    return Environment(50*k, 30*k, 1, n, seed=seed)
+
+class SafePoints(object):
+
+    params = ([10, 100, 1000], [1000, 100000], [False, True])
+    param_names = ['obstacles', 'points', 'fast']
+
+    def setup(self, n, m, fast):
+        self.env = environment(n)
+        rng = np.random.default_rng(1)
+        self.pts = rng.uniform([0, 0], [self.env.lx, self.env.ly], (m, 2))
+        if fast:
+            self.env.raster()
+
+    def time_safe_points(self, n, m, fast):
+        self.env.safe_points(self.pts, fast)
+
+class SafeSegments(object):
+
+    params = ([10, 100, 1000], [1000, 100000], [False, True])
+    param_names = ['obstacles', 'segments', 'fast']
+
+    def setup(self, n, m, fast):
+        self.env = environment(n)
+        rng = np.random.default_rng(1)
+        p = rng.uniform([0, 0], [self.env.lx, self.env.ly], (m, 2))
+        self.segs = np.stack((p, p + rng.normal(0, 0.5, (m, 2))), axis=1)
+        if fast:
+            self.env.raster()
+
+    def time_safe_segments(self, n, m, fast):
+        self.env.safe_segments(self.segs, fast)
+
+class SafeScalar(object):
+
+    params = [10, 100, 1000]
+    param_names = ['obstacles']
+
+    def setup(self, n):
+        self.env = environment(n)
+        self.p = np.array([self.env.lx/2, self.env.ly/2])
+        self.seg = np.array([[self.env.lx/2, self.env.ly/2], [self.env.lx/2 + 0.05, self.env.ly/2]])
+
+    def time_safe_point(self, n):
+        self.env.safe(self.p)
+
+    def time_safe_segment(self, n):
+        self.env.safe(self.seg)
+
+class PointInside(object):
+
+    params = [10, 100]
+    param_names = ['vertices']
+
+    def setup(self, nvert):
+        from dubins.obstacle import Obstacle
+        self.ob = Obstacle(0, 0, 2, 6, nvert, rng=np.random.default_rng(0))
+        self.pts = np.random.default_rng(1).uniform(-3, 3, (100, 2))
+
+    def time_point_inside(self, nvert):
+        for p in self.pts:
+            self.ob.point_inside(p)
+
+class Generation(object):
+
+    # the largest raster takes about a minute
+    timeout = 300
+
+    params = [10, 100, 1000]
+    param_names = ['obstacles']
+
+    def setup(self, n):
+        self.env = environment(n)
+
+    def time_gen_obs(self, n):
+        self.env.gen_obs()
+
+    def time_raster(self, n):
+        self.env._raster = None
+        self.env.raster()
@@ -0,0 +1,44 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+'''
+Import cost of the package in fresh interpreters. Importing dubins
+should not pull in matplotlib, scipy, or numba, and should take at most
+TARGET seconds beyond importing numpy.
+'''
+
+import subprocess, sys
+
+# seconds allowed for importing dubins once numpy is loaded
+TARGET = 0.1
+
+# modules only needed for plotting, the rk45 integrator, or the numba backend
+HEAVY = ('matplotlib', 'scipy', 'numba')
+
+def timeraw_import_dubins():
+    return 'import dubins', 'import numpy'
+
+def timeraw_import_batch():
+    return 'import dubins.batch', 'import numpy'
+
+def track_heavy_modules():
+
+    # heavy modules loaded by importing dubins
+    code = 'import sys, dubins; print(sum(m in sys.modules for m in {}))'.format(HEAVY)
+    return int(subprocess.check_output([sys.executable, '-c', code]))
+
+track_heavy_modules.unit = 'modules'
+
+def import_time(module='dubins', repeat=5):
+
+    # best time over fresh interpreters, less the time to import numpy
+    code = 'import time, numpy; t = time.perf_counter(); import {}; print(time.perf_counter() - t)'.format(module)
+    return min(float(subprocess.check_output([sys.executable, '-c', code])) for i in range(repeat))
+
+if __name__ == '__main__':
+
+    # check the import budget
+    t, n = import_time(), track_heavy_modules()
+    print('import dubins: {0:.3f} s (target {1:.3f} s), heavy modules loaded: {2}'.format(t, TARGET, n))
+    if t > TARGET or n > 0:
+        sys.exit(1)
@@ -0,0 +1,65 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+'''
+Integration and simulation throughput against horizon length, for each
+integrator, with fixed seeds. Obstacle-free maps keep every rollout
+alive for the full horizon.
+'''
+
+import numpy as np
+from dubins.mission import Mission
+from dubins.dynamics import Dynamics
+from dubins.environment import Environment
+
+def mission(integrator, n=0):
+
+    # long map, so rollouts stay inside over long horizons
+    return Mission(Dynamics(1, 1), Environment(1000, 30, 1, n, seed=0), integrator=integrator)
+
+class Step(object):
+
+    params = (['rk45', 'rk4', 'arc'], [1, 10, 100])
+    param_names = ['integrator', 'duration']
+
+    def setup(self, integrator, Dt):
+        self.mission = mission(integrator)
+
+    def time_step_scalar(self, integrator, Dt):
+        self.mission.step(0.0, Dt=float(Dt))
+
+    def time_step_callable(self, integrator, Dt):
+        self.mission.step(lambda t, s: 0.0, Dt=float(Dt))
+
+    def time_step_single(self, integrator, Dt):
+        self.mission.step(0.0)
+
+class Simulate(object):
+
+    # rk45 over the longest horizon takes tens of seconds
+    timeout = 300
+
+    params = (['rk45', 'rk4', 'arc'], [10, 100, 1000])
+    param_names = ['integrator', 'horizon']
+
+    def setup(self, integrator, T):
+        self.mission = mission(integrator)
+        self.controls = np.zeros(10)
+        self.times = np.linspace(0, T, 11)
+
+    def time_simulate(self, integrator, T):
+        self.mission.simulate(self.controls, self.times)
+
+class SimulateBatch(object):
+
+    params = (['rk4', 'arc'], [10, 100, 1000])
+    param_names = ['integrator', 'rollouts']
+
+    def setup(self, integrator, n):
+        self.mission = mission(integrator)
+        rng = np.random.default_rng(1)
+        self.controls = rng.uniform(-0.001, 0.001, (n, 10))
+        self.times = np.linspace(0, 100, 11)
+
+    def time_simulate_batch(self, integrator, n):
+        self.mission.simulate_batch(self.controls, self.times)
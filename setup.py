@@ -12,5 +12,6 @@ setup(
     packages=['dubins'],
     url='https://github.com/cisprague/dubins',
     description='Code for the DD2410 planning assignment at KTH.',
-    install_requires=['numpy', 'matplotlib', 'scipy', 'jupyter']
+    install_requires=['numpy', 'matplotlib', 'scipy', 'jupyter'],
+    extras_require={'numba': ['numba']}
 )
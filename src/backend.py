@@ -0,0 +1,368 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+'''
+Compiled kernels for the scalar hot paths: point in polygon, segment
+intersection, point and segment queries against an environment's grid
+and obstacle arrays, the Dubins car's equations of motion and
+fixed-step integration, and the shooting method's integration of
+fullstates and transition matrices. They are compiled with numba when it is
+installed, and otherwise run as plain Python. Callers use them only
+when the module-level backend, chosen with use, is 'numba', and keep
+their NumPy code as the fallback. numba is only imported, and the
+kernels compiled, on first use.
+'''
+
+import importlib.util, numpy as np
+
+# whether numba is installed, without importing it
+NUMBA = importlib.util.find_spec('numba') is not None
+
+# selected backend, compiled by default when available
+BACKEND = 'numba' if NUMBA else 'python'
+
+# kernels, as plain Python functions, and whether they have been compiled
+_kernels = dict()
+_compiled = False
+
+def use(name=None):
+
+    # get, or set, the backend
+    global BACKEND
+    if name is not None:
+        if name not in ('numba', 'python'):
+            raise ValueError('Unknown backend {}.'.format(name))
+        if name == 'numba' and not NUMBA:
+            raise ValueError('The numba backend needs numba installed.')
+        BACKEND = name
+    return BACKEND
+
+def active():
+
+    # compile on first use of the numba backend
+    if BACKEND != 'numba':
+        return False
+    if not _compiled:
+        _compile()
+    return True
+
+def _compile():
+
+    # replace every kernel with its nopython version, which resolves
+    # the kernels it calls from this module when first called
+    global _compiled
+    import numba
+    for name, fun in _kernels.items():
+        globals()[name] = numba.njit(cache=True)(fun)
+    _compiled = True
+
+def _jit(fun):
+
+    # register kernel for compiling
+    _kernels[fun.__name__] = fun
+    return fun
+
+@_jit
+def orientation(px, py, qx, qy, rx, ry):
+
+    # orientation of triplet, as util.orientation
+    val = (qy - py)*(rx - qx) - (qx - px)*(ry - qy)
+    if val == 0:
+        return 0
+    elif val > 0:
+        return 1
+    else:
+        return 2
+
+@_jit
+def onseg(px, py, qx, qy, rx, ry):
+
+    # q within the bounding box of p and r, as util.onseg
+    return qx <= max(px, rx) and qx >= min(px, rx) and qy <= max(py, ry) and qy >= min(py, ry)
+
+@_jit
+def intersection(seg0, seg1):
+
+    # extract points
+    p0x, p0y, q0x, q0y = seg0[0, 0], seg0[0, 1], seg0[1, 0], seg0[1, 1]
+    p1x, p1y, q1x, q1y = seg1[0, 0], seg1[0, 1], seg1[1, 0], seg1[1, 1]
+
+    # orientations
+    o0 = orientation(p0x, p0y, q0x, q0y, p1x, p1y)
+    o1 = orientation(p0x, p0y, q0x, q0y, q1x, q1y)
+    o2 = orientation(p1x, p1y, q1x, q1y, p0x, p0y)
+    o3 = orientation(p1x, p1y, q1x, q1y, q0x, q0y)
+
+    # general intersection and special colinear cases, as util.intersection
+    return (
+        (o0 != o1 and o2 != o3) or
+        (o0 == 0 and onseg(p0x, p0y, p1x, p1y, q0x, q0y)) or
+        (o1 == 0 and onseg(p0x, p0y, q1x, q1y, q0x, q0y)) or
+        (o2 == 0 and onseg(p1x, p1y, p0x, p0y, q1x, q1y)) or
+        (o3 == 0 and onseg(p1x, p1y, q0x, q0y, q1x, q1y))
+    )
+
+@_jit
+def point_inside(verts, x, y):
+
+    # ray crossing parity, as Obstacle.point_inside
+    n = verts.shape[0]
+    x0, y0 = verts[0, 0], verts[0, 1]
+    inside = False
+    for i in range(n + 1):
+        x1, y1 = verts[i%n, 0], verts[i%n, 1]
+        if y > min(y0, y1) and y <= max(y0, y1) and x <= max(x0, x1):
+            if x0 == x1:
+                inside = not inside
+            elif y0 != y1 and x <= (y - y0)*(x1 - x0)/(y1 - y0) + x0:
+                inside = not inside
+        x0, y0 = x1, y1
+
+    return inside
+
+@_jit
+def line_intersect(verts, seg):
+
+    # intersection with any open edge, as Obstacle.line_intersect
+    for i in range(verts.shape[0] - 1):
+        if intersection(seg, verts[i:i + 2]):
+            return True
+
+    return False
+
+@_jit
+def cell(x, size, n):
+
+    # clipped grid cell coordinate, as Grid.cell
+    c = np.floor(x/size)
+    if not c >= 0:
+        return 0
+    if c > n - 1:
+        return n - 1
+    return int(c)
+
+@_jit
+def safe_point(x, y, lx, ly, size, nx, ny, start, items, centres, radii, verts, offsets):
+
+    # check if within boundaries
+    if x < 0 or x > lx or y < 0 or y > ly:
+        return False
+
+    # candidate obstacles in the point's cell, by bounding circle then polygon
+    c = cell(y, size, ny)*nx + cell(x, size, nx)
+    for a in range(start[c], start[c + 1]):
+        o = items[a]
+        dx, dy = x - centres[o, 0], y - centres[o, 1]
+        if dx**2 + dy**2 <= radii[o]**2 and point_inside(verts[offsets[o]:offsets[o + 1]], x, y):
+            return False
+
+    return True
+
+@_jit
+def safe_points(pts, lx, ly, size, nx, ny, start, items, centres, radii, verts, offsets):
+
+    '''
+    Safety of points of shape (n, 2), as Environment.safe_points: within
+    the area, and outside the polygon of every obstacle listed in the
+    point's grid cell whose bounding circle contains it.
+    '''
+
+    out = np.empty(pts.shape[0], np.bool_)
+    for k in range(pts.shape[0]):
+        out[k] = safe_point(pts[k, 0], pts[k, 1], lx, ly, size, nx, ny, start, items, centres, radii, verts, offsets)
+    return out
+
+@_jit
+def safe_segment(seg, bedges, size, nx, ny, start, items, centres, radii, verts, offsets):
+
+    # check if intersecting boundaries
+    for b in range(bedges.shape[0]):
+        if intersection(seg, bedges[b]):
+            return False
+
+    # segment start and direction, for distances to obstacle centres
+    px, py = seg[0, 0], seg[0, 1]
+    dx, dy = seg[1, 0] - px, seg[1, 1] - py
+    dd = dx**2 + dy**2
+
+    # candidate obstacles over the cells of the bounding box
+    i0, i1 = cell(min(px, seg[1, 0]), size, nx), cell(max(px, seg[1, 0]), size, nx)
+    j0, j1 = cell(min(py, seg[1, 1]), size, ny), cell(max(py, seg[1, 1]), size, ny)
+    for j in range(j0, j1 + 1):
+        for i in range(i0, i1 + 1):
+            c = j*nx + i
+            for a in range(start[c], start[c + 1]):
+                o = items[a]
+
+                # bounding circle reject, by distance from centre to segment, then open edges
+                t = ((centres[o, 0] - px)*dx + (centres[o, 1] - py)*dy)/dd if dd > 0 else 0.0
+                t = min(max(t, 0.0), 1.0)
+                rx, ry = px + t*dx - centres[o, 0], py + t*dy - centres[o, 1]
+                if rx**2 + ry**2 <= radii[o]**2 and line_intersect(verts[offsets[o]:offsets[o + 1]], seg):
+                    return False
+
+    return True
+
+@_jit
+def safe_segments(segs, bedges, size, nx, ny, start, items, centres, radii, verts, offsets):
+
+    '''
+    Safety of segments of shape (n, 2, 2), as Environment.safe_segments:
+    crossing no boundary edge, nor the open edges of any obstacle listed
+    in the cells of the segment's bounding box whose bounding circle it
+    passes through.
+    '''
+
+    out = np.empty(segs.shape[0], np.bool_)
+    for k in range(segs.shape[0]):
+        out[k] = safe_segment(segs[k], bedges, size, nx, ny, start, items, centres, radii, verts, offsets)
+    return out
+
+@_jit
+def eom(y, u, v, l):
+
+    # Dubins car rates of states y of shape (3, n) under one steering angle u, as Dynamics.eom_state
+    out = np.empty(y.shape)
+    w = np.tan(u)/l
+    for j in range(y.shape[1]):
+        out[0, j] = v*np.cos(y[2, j])
+        out[1, j] = v*np.sin(y[2, j])
+        out[2, j] = w
+    return out
+
+@_jit
+def rk4(y, u, v, l, t, times):
+
+    '''
+    Fourth order Runge-Kutta integration of the Dubins car from states y
+    of shape (3, n) under steering angles u of shape (n,), stepping from
+    t to each of times in turn, as RK4.propagate with Dynamics. Returns
+    states of shape (3, n, m).
+    '''
+
+    n, m = y.shape[1], times.shape[0]
+    out = np.empty((3, n, m))
+    for j in range(n):
+
+        # constant turning rate under constant steering
+        w = np.tan(u[j])/l
+        x0, y0, th = y[0, j], y[1, j], y[2, j]
+        tc = t
+        for k in range(m):
+
+            # stages, whose rates only depend on heading
+            h = times[k] - tc
+            t1 = th
+            t2 = th + h/2*w
+            t3 = th + h/2*w
+            t4 = th + h*w
+            x0 = x0 + h/6*(v*np.cos(t1) + 2*v*np.cos(t2) + 2*v*np.cos(t3) + v*np.cos(t4))
+            y0 = y0 + h/6*(v*np.sin(t1) + 2*v*np.sin(t2) + 2*v*np.sin(t3) + v*np.sin(t4))
+            th = th + h/6*(w + 2*w + 2*w + w)
+            tc = times[k]
+
+            out[0, j, k], out[1, j, k], out[2, j, k] = x0, y0, th
+
+    return out
+
+@_jit
+def costate_rates(z, P, l, alpha, f, g):
+
+    '''
+    Rates of one fullstate z of shape (10,), and its transition matrix P
+    of shape (10, 5), of Dynamics_2nd under the Hamiltonian minimising
+    control, written into f and g, as Shooting._rates. Returns the
+    running cost.
+    '''
+
+    # optimal control, and its dependence on the costate when unsaturated
+    u = (alpha + z[9])/(2*(alpha - 1))
+    du = 1/(2*(alpha - 1))
+    if u >= 1 or u <= -1:
+        u = min(max(u, -1.0), 1.0)
+        du = 0.0
+
+    # common subexpressions
+    s, c, t = np.sin(z[2]), np.cos(z[2]), np.tan(z[3])
+    x2 = 1/(l*np.cos(z[3])**2)
+
+    # fullstate rate
+    f[0], f[1], f[2], f[3], f[4] = c, s, t/l, z[4], u
+    f[5], f[6] = 0.0, 0.0
+    f[7], f[8], f[9] = z[5]*s - z[6]*c, -z[7]*x2, -z[8]
+
+    # transition matrix rate, from the nonzero rows of the Jacobian
+    a7 = z[5]*c + z[6]*s
+    a8 = -2*z[7]*x2*t
+    for k in range(5):
+        g[0, k] = -s*P[2, k]
+        g[1, k] = c*P[2, k]
+        g[2, k] = x2*P[3, k]
+        g[3, k] = P[4, k]
+        g[4, k] = du*P[9, k]
+        g[5, k] = 0.0
+        g[6, k] = 0.0
+        g[7, k] = a7*P[2, k] + s*P[5, k] - c*P[6, k]
+        g[8, k] = a8*P[3, k] - x2*P[7, k]
+        g[9, k] = -P[8, k]
+
+    # running cost, as Dynamics_2nd.lagrangian
+    return u*(alpha + u*(1 - alpha))
+
+@_jit
+def shoot(z, P, h, steps, keep, l, alpha):
+
+    '''
+    Fourth order Runge-Kutta integration of fullstates z of shape (10, n)
+    and transition matrices P of shape (10, 5, n) over steps steps of h,
+    as Shooting.propagate. Returns the fullstates at the steps in keep,
+    of shape (10, n, m), the final transition matrices, and the costs.
+    '''
+
+    n, m = z.shape[1], keep.shape[0]
+    Z = np.empty((10, n, m))
+    Pf = np.empty((10, 5, n))
+    J = np.zeros(n)
+
+    # stage offsets, rates, and states
+    c = np.array([0.0, h/2, h/2, h])
+    f = np.empty((4, 10))
+    g = np.empty((4, 10, 5))
+    L = np.empty(4)
+    zs = np.empty(10)
+    Ps = np.empty((10, 5))
+
+    for j in range(n):
+
+        zj = z[:, j].copy()
+        Pj = P[:, :, j].copy()
+        r = 0
+        while r < m and keep[r] == 0:
+            Z[:, j, r] = zj
+            r += 1
+
+        for i in range(1, steps + 1):
+
+            # stages, from the previous stage's rates
+            for q in range(4):
+                for a in range(10):
+                    zs[a] = zj[a] if q == 0 else zj[a] + c[q]*f[q - 1, a]
+                    for b in range(5):
+                        Ps[a, b] = Pj[a, b] if q == 0 else Pj[a, b] + c[q]*g[q - 1, a, b]
+                L[q] = costate_rates(zs, Ps, l, alpha, f[q], g[q])
+
+            # step
+            for a in range(10):
+                zj[a] += h/6*(f[0, a] + 2*f[1, a] + 2*f[2, a] + f[3, a])
+                for b in range(5):
+                    Pj[a, b] += h/6*(g[0, a, b] + 2*g[1, a, b] + 2*g[2, a, b] + g[3, a, b])
+            J[j] += h/6*(L[0] + 2*L[1] + 2*L[2] + L[3])
+
+            # record
+            while r < m and keep[r] == i:
+                Z[:, j, r] = zj
+                r += 1
+
+        Pf[:, :, j] = Pj
+
+    return Z, Pf, J
@@ -0,0 +1,133 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+'''
+Process-pool evaluation of planners and control sequences over many
+random environments. Each job is a tuple (seed, planner, controls):
+
+    seed     -- integer seeding the environment and the planner
+    planner  -- None, a name in PLANNERS, or a picklable callable taking
+                a mission and its seed and returning (controls, times)
+    controls -- None, or (controls, times) to simulate when there is
+                no planner
+
+Jobs are sent to the workers in chunks and their results are yielded
+as soon as each chunk finishes, so a long run can be monitored or
+stopped early.
+'''
+
+import time, functools, multiprocessing, numpy as np
+from .mission import Mission
+from .dynamics import Dynamics
+from .environment import Environment
+from .planner import RRT, RRTStar
+from .lattice import Lattice
+
+def _lattice(mission, seed=None):
+
+    # deterministic search, taking no seed
+    return Lattice(mission)
+
+# planners by name, taking a mission and a seed
+PLANNERS = {'rrt': RRT, 'rrtstar': RRTStar, 'lattice': _lattice}
+
+def _plan(planner, mission, seed, budget):
+
+    # planner by name, with its own seeded generator
+    if isinstance(planner, str):
+        return PLANNERS[planner.lower()](mission, seed=seed).plan(budget=budget)
+
+    # or a user function
+    else:
+        return planner(mission, seed)
+
+def evaluate(job, env=(50, 30, 1, 20), dyn=(1, 1), integrator='arc', budget=None):
+
+    # unpack job
+    seed, planner, controls = job
+    seed = int(seed)
+
+    # deterministic environment for this seed
+    mission = Mission(Dynamics(*dyn), Environment(*env, seed=seed), integrator=integrator)
+
+    # plan controls, or take the given ones
+    t0 = time.perf_counter()
+    if planner is not None:
+        controls = _plan(planner, mission, seed, budget)
+    t1 = time.perf_counter()
+
+    # simulate, with no progress if there is no plan
+    if controls is None or len(controls[0]) == 0:
+        score = 0.0
+    else:
+        score = float(mission.simulate(*controls))
+    t2 = time.perf_counter()
+
+    return dict(
+        seed=seed,
+        planner=planner if isinstance(planner, str) or planner is None else getattr(planner, '__name__', str(planner)),
+        score=score,
+        solved=score == 1,
+        plan=t1 - t0,
+        simulate=t2 - t1
+    )
+
+def _evaluate(indexed, **kwargs):
+
+    # keep the job's position for unordered collection
+    i, job = indexed
+    result = evaluate(job, **kwargs)
+    result['index'] = i
+    return result
+
+def run(jobs, processes=None, chunksize=None, ordered=False, **kwargs):
+
+    '''
+    Evaluate jobs over a pool of processes, yielding one result dict per
+    job (seed, planner, score, solved, plan and simulate times, and the
+    job's index) as they complete, or in job order if ordered. Keyword
+    arguments are passed on to evaluate.
+    '''
+
+    # number the jobs
+    jobs = list(enumerate(jobs))
+    fun = functools.partial(_evaluate, **kwargs)
+
+    # default to all cores
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(min(int(processes), len(jobs)), 1)
+
+    # run in this process if only one worker
+    if processes == 1:
+        for job in jobs:
+            yield fun(job)
+        return
+
+    # a few chunks per worker, balancing load against messaging
+    if chunksize is None:
+        chunksize = max(len(jobs)//(4*processes), 1)
+
+    with multiprocessing.Pool(processes) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(fun, jobs, chunksize):
+            yield result
+
+def collect(results):
+
+    # stack streamed results into arrays, in job order
+    results = sorted(results, key=lambda r: r['index'])
+    return {key: np.array([r[key] for r in results]) for key in results[0]} if len(results) > 0 else dict()
+
+def jobs(seeds, planner=None, controls=None):
+
+    # one job per seed, sharing the planner or controls
+    return [(seed, planner, controls) for seed in seeds]
+
+if __name__ == '__main__':
+
+    # compare planners over a few environments
+    for name in PLANNERS:
+        t = time.perf_counter()
+        res = collect(run(jobs(range(16), name), budget=2))
+        print('{0:<10} solved: {1:<5} mean score: {2:<8.3f} wall time: {3:<8.2f}'.format(name, res['solved'].sum(), res['score'].mean(), time.perf_counter() - t))
@@ -0,0 +1,59 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+
+class Buffer(object):
+
+    '''
+    Array that grows along its first axis, doubling its capacity when full
+    so that appending is amortised constant time. Views of the filled part
+    stay valid, as clearing starts a new array rather than overwriting.
+    '''
+
+    def __init__(self, shape=(), capacity=16, dtype=float):
+
+        # shape of each element
+        self.shape = tuple(shape)
+
+        # storage and number of filled elements
+        self.data = np.empty((max(int(capacity), 1),) + self.shape, dtype)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def view(self):
+        return self.data[:self.n]
+
+    def reserve(self, n):
+
+        # double capacity until n elements fit
+        if n > len(self.data):
+            capacity = len(self.data)
+            while capacity < n:
+                capacity *= 2
+            data = np.empty((capacity,) + self.shape, self.data.dtype)
+            data[:self.n] = self.data[:self.n]
+            self.data = data
+
+    def append(self, value):
+
+        # add one element
+        self.reserve(self.n + 1)
+        self.data[self.n] = value
+        self.n += 1
+
+    def extend(self, values):
+
+        # add a stack of elements, or one element
+        values = np.asarray(values, self.data.dtype).reshape((-1,) + self.shape)
+        self.reserve(self.n + len(values))
+        self.data[self.n:self.n + len(values)] = values
+        self.n += len(values)
+
+    def clear(self):
+
+        # start a new array of the same capacity
+        self.data = np.empty_like(self.data)
+        self.n = 0
@@ -0,0 +1,76 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import collections, numpy as np
+
+class LRU(object):
+
+    '''
+    Bounded least recently used memo of per-row query results, keyed on
+    each row of the query array rounded to a multiple of quantum, so that
+    nearly identical queries share an entry, and the result of the first
+    of them is returned for all. Misses are computed together in one
+    batch, and the least recently used entries are evicted beyond size.
+    '''
+
+    def __init__(self, size=65536, quantum=1e-6):
+
+        # capacity and key resolution
+        self.size = int(size)
+        self.quantum = float(quantum)
+
+        # entries, oldest first, and counters
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+
+        # drop entries, as when the queried objects change, keeping counters
+        self._entries.clear()
+
+    def info(self):
+
+        # counters and occupancy
+        return dict(hits=self.hits, misses=self.misses, size=len(self), maxsize=self.size)
+
+    def lookup(self, tag, rows, compute):
+
+        '''
+        Results for each row of rows, of shape (n, ...), under tag, from the
+        memo where present, and otherwise from compute called once on the
+        array of missing rows, returning one result per row.
+        '''
+
+        # quantised row keys
+        rows = np.asarray(rows)
+        keys = np.round(rows.reshape(len(rows), int(np.prod(rows.shape[1:])))/self.quantum).astype(np.int64)
+        keys = [(tag, k.tobytes()) for k in keys]
+
+        # hits, refreshed as most recently used, and first rows of distinct misses
+        res = [None]*len(keys)
+        miss = collections.OrderedDict()
+        for i, key in enumerate(keys):
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                res[i] = self._entries[key]
+            else:
+                miss.setdefault(key, list()).append(i)
+        self.misses += len(miss)
+        self.hits += len(keys) - len(miss)
+
+        # misses computed together, and stored, evicting the least recently used
+        if len(miss) > 0:
+            vals = compute(rows[[idx[0] for idx in miss.values()]])
+            for (key, idx), val in zip(miss.items(), vals):
+                self._entries[key] = val
+                self._entries.move_to_end(key)
+                for i in idx:
+                    res[i] = val
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+        return np.array(res)
@@ -0,0 +1,317 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+
+class Collocation(object):
+
+    '''
+    Direct collocation of a mission as a sparse nonlinear program, with
+    Hermite-Simpson defects between n + 1 state knots under one constant
+    control per interval, and a free final time. The car starts at rest
+    at the origin, ends on the target, keeps a clearance margin from the
+    environment's signed distance field at every knot, and minimises
+    final time plus weighted control effort. Constraint Jacobians are
+    assembled sparse from the dynamics' state and control Jacobians, and
+    Hessians sparse from differences of each interval's and knot's local
+    gradients, so that scipy's trust-constr solver never forms either
+    densely.
+    '''
+
+    def __init__(self, mission, n=100, margin=0.5, weight=1.0):
+
+        # mission, its dynamics, and environment
+        self.mission = mission
+        self._dynamics = mission._dynamics
+        self._environment = mission._environment
+
+        # number of intervals, clearance margin, and control effort weight
+        self.n = int(n)
+        self.margin = float(margin)
+        self.weight = float(weight)
+
+        # control bounds
+        self.umax = getattr(self._dynamics, 'umax', 1.0)
+
+        # initial state at the origin, at rest
+        self.s0 = np.hstack((mission.origin, np.zeros(self._dynamics.sdim - 2)))
+
+        # solution
+        self.result = None
+
+    def pack(self, states, controls, tf):
+
+        # decision vector of states of shape (n + 1, sdim), controls of shape (n,), and final time
+        return np.hstack((np.ravel(states), np.ravel(controls), tf))
+
+    def unpack(self, x):
+
+        # states, controls, and final time of a decision vector
+        sdim, n = self._dynamics.sdim, self.n
+        return x[:(n + 1)*sdim].reshape(n + 1, sdim), x[(n + 1)*sdim:-1], x[-1]
+
+    def guess(self, controls=None, times=None):
+
+        '''
+        Initial decision vector, following the given piecewise-constant
+        controls, such as a planner's solution, as simulated by the
+        mission, or otherwise the straight line to the target.
+        '''
+
+        sdim, n = self._dynamics.sdim, self.n
+
+        # straight line at constant speed, turning onto it at the start
+        if controls is None:
+            d = self.mission.target - self.mission.origin
+            tf = np.linalg.norm(d)/self._dynamics.v
+            states = np.zeros((n + 1, sdim))
+            states[:, :2] = self.mission.origin + np.linspace(0, 1, n + 1)[:, None]*d
+            states[1:, 2] = np.arctan2(d[1], d[0])
+            return self.pack(states, np.zeros(n), tf)
+
+        # simulated states at the knots, and the control over each interval
+        self.mission.simulate(controls, times)
+        T, S = self.mission.times, self.mission.states
+        t = np.linspace(0, T[-1], n + 1)
+        states = np.column_stack([np.interp(t, T, S[:, i]) for i in range(sdim)])
+        u = np.asarray(controls, float)[np.clip(np.searchsorted(times, t[:-1], 'right') - 1, 0, len(controls) - 1)]
+        return self.pack(states, u, T[-1])
+
+    def _intervals(self, x):
+
+        # interval start and end states of shape (sdim, n), controls, and step
+        S, u, tf = self.unpack(x)
+        return S[:-1].T, S[1:].T, u, tf/self.n
+
+    def defects(self, x):
+
+        # Hermite-Simpson defect of every interval, of shape (n*sdim,)
+        f = self._dynamics.eom_state
+        s0, s1, u, h = self._intervals(x)
+        f0, f1 = f(s0, u), f(s1, u)
+        fm = f((s0 + s1)/2 + h/8*(f0 - f1), u)
+        return (s1 - s0 - h/6*(f0 + 4*fm + f1)).T.ravel()
+
+    def _blocks(self, s0, s1, u, tf):
+
+        # derivatives of each interval's defect with respect to its start and end knots,
+        # of shape (sdim, sdim, n), and its control and the final time, of shape (sdim, n)
+        f, A, B = self._dynamics.eom_state, self._dynamics.eom_state_jac, self._dynamics.eom_control_jac
+        sdim, n = self._dynamics.sdim, self.n
+        h = tf/n
+        I = np.eye(sdim)[..., None]
+
+        # rates and Jacobians at the knots and the interpolated midpoint
+        f0, f1 = f(s0, u), f(s1, u)
+        sm = (s0 + s1)/2 + h/8*(f0 - f1)
+        fm = f(sm, u)
+        A0, A1, Am = A(s0, u), A(s1, u), A(sm, u)
+        B0, B1, Bm = B(s0, u)[:, 0], B(s1, u)[:, 0], B(sm, u)[:, 0]
+
+        # midpoint derivatives
+        dm0 = I/2 + h/8*A0
+        dm1 = I/2 - h/8*A1
+        dmu = h/8*(B0 - B1)
+        dmt = (f0 - f1)/(8*n)
+
+        # defect derivatives
+        mul = lambda a, b: np.einsum('ijn,jkn->ikn', a, b)
+        D0 = -I - h/6*(A0 + 4*mul(Am, dm0))
+        D1 = I - h/6*(A1 + 4*mul(Am, dm1))
+        Du = -h/6*(B0 + 4*(Bm + np.einsum('ijn,jn->in', Am, dmu)) + B1)
+        Dt = -(f0 + 4*fm + f1)/(6*n) - h/6*4*np.einsum('ijn,jn->in', Am, dmt)
+
+        return D0, D1, Du, Dt
+
+    def _columns(self):
+
+        # columns of each interval's local variables, start knot, end knot, control, and final time, of shape (n, 2*sdim + 2)
+        sdim, n = self._dynamics.sdim, self.n
+        k = np.arange(n)[:, None]
+        return np.hstack((k*sdim + np.arange(2*sdim), (n + 1)*sdim + k, np.full((n, 1), (n + 1)*sdim + n)))
+
+    def defects_jac(self, x):
+
+        # sparse Jacobian of the defects, with respect to both knots, the control, and the final time
+        from scipy.sparse import coo_matrix
+        s0, s1, u, h = self._intervals(x)
+        sdim, n = self._dynamics.sdim, self.n
+        D0, D1, Du, Dt = self._blocks(s0, s1, u, x[-1])
+
+        # local Jacobians of shape (n, sdim, 2*sdim + 2), placed at each interval's rows and columns
+        D = np.concatenate((D0, D1, Du[:, None], Dt[:, None]), axis=1).transpose(2, 0, 1)
+        rows = np.arange(n*sdim).reshape(n, sdim)[:, :, None]
+        cols = self._columns()[:, None, :]
+        rows, cols = np.broadcast_arrays(rows, cols)
+
+        return coo_matrix((D.ravel(), (rows.ravel(), cols.ravel())), shape=(n*sdim, len(x))).tocsr()
+
+    def defects_hess(self, x, v, eps=1e-7):
+
+        '''
+        Sparse Hessian of the defects weighted by multipliers v. Each
+        interval's weighted defect depends only on its own 2*sdim + 2
+        variables, so its Hessian block is found by differencing its
+        analytic gradient along each of them, for all intervals at once,
+        and the blocks are summed into place.
+        '''
+
+        from scipy.sparse import coo_matrix
+        s0, s1, u, h = self._intervals(x)
+        sdim, n = self._dynamics.sdim, self.n
+        v = np.reshape(v, (n, sdim)).T
+
+        # local variables of every interval, of shape (2*sdim + 2, n)
+        z = np.vstack((s0, s1, u, np.full(n, x[-1])))
+
+        def grad(z):
+
+            # gradient of each interval's weighted defect in its local variables
+            D0, D1, Du, Dt = self._blocks(z[:sdim], z[sdim:2*sdim], z[2*sdim], z[-1])
+            return np.vstack((
+                np.einsum('in,ijn->jn', v, D0),
+                np.einsum('in,ijn->jn', v, D1),
+                (v*Du).sum(axis=0),
+                (v*Dt).sum(axis=0)
+            ))
+
+        # central differences along each local variable, of shape (n, 2*sdim + 2, 2*sdim + 2)
+        H = np.empty((n, len(z), len(z)))
+        for a in range(len(z)):
+            dz = np.zeros((len(z), 1))
+            dz[a] = eps
+            H[:, :, a] = ((grad(z + dz) - grad(z - dz))/(2*eps)).T
+        H = (H + H.transpose(0, 2, 1))/2
+
+        # blocks summed into place, where intervals share knots and the final time
+        cols = self._columns()
+        rows, cols = np.broadcast_arrays(cols[:, :, None], cols[:, None, :])
+        return coo_matrix((H.ravel(), (rows.ravel(), cols.ravel())), shape=(len(x), len(x))).tocsr()
+
+    def clearance(self, x):
+
+        # clearance of every knot
+        S, u, tf = self.unpack(x)
+        return self._environment.clearance(S[:, :2])
+
+    def clearance_jac(self, x):
+
+        # sparse Jacobian of the clearances, with respect to each knot's position
+        from scipy.sparse import coo_matrix
+        S, u, tf = self.unpack(x)
+        sdim, m = self._dynamics.sdim, len(S)
+        c, g = self._environment.clearance(S[:, :2], grad=True)
+        rows = np.repeat(np.arange(m), 2)
+        cols = (np.arange(m)[:, None]*sdim + np.arange(2)).ravel()
+        return coo_matrix((g.ravel(), (rows, cols)), shape=(m, len(x))).tocsr()
+
+    def clearance_hess(self, x, v, eps=1e-7):
+
+        # sparse Hessian of the clearances weighted by multipliers v, by differencing
+        # their gradients along each coordinate of every knot at once
+        from scipy.sparse import coo_matrix
+        S, u, tf = self.unpack(x)
+        sdim, m = self._dynamics.sdim, len(S)
+        p = S[:, :2]
+        H = np.empty((m, 2, 2))
+        for a in range(2):
+            dp = np.zeros(2)
+            dp[a] = eps
+            gp = self._environment.clearance(p + dp, grad=True)[1]
+            gm = self._environment.clearance(p - dp, grad=True)[1]
+            H[:, :, a] = v[:, None]*(gp - gm)/(2*eps)
+        H = (H + H.transpose(0, 2, 1))/2
+        cols = np.arange(m)[:, None]*sdim + np.arange(2)
+        rows, cols = np.broadcast_arrays(cols[:, :, None], cols[:, None, :])
+        return coo_matrix((H.ravel(), (rows.ravel(), cols.ravel())), shape=(len(x), len(x))).tocsr()
+
+    def cost(self, x):
+
+        # final time and control effort
+        S, u, tf = self.unpack(x)
+        return tf + self.weight*tf/self.n*np.sum(u**2)
+
+    def cost_grad(self, x):
+
+        # gradient of the cost, only in the controls and final time
+        S, u, tf = self.unpack(x)
+        g = np.zeros_like(x)
+        g[S.size:-1] = 2*self.weight*tf/self.n*u
+        g[-1] = 1 + self.weight/self.n*np.sum(u**2)
+        return g
+
+    def cost_hess(self, x):
+
+        # sparse Hessian of the cost, coupling each control with the final time
+        from scipy.sparse import coo_matrix
+        S, u, tf = self.unpack(x)
+        c = S.size + np.arange(self.n)
+        t = len(x) - 1
+        rows = np.hstack((c, c, np.full(self.n, t)))
+        cols = np.hstack((c, np.full(self.n, t), c))
+        vals = np.hstack((np.full(self.n, 2*self.weight*tf/self.n), 2*self.weight/self.n*u, 2*self.weight/self.n*u))
+        return coo_matrix((vals, (rows, cols)), shape=(len(x), len(x))).tocsr()
+
+    def boundary(self, x):
+
+        # linear boundary conditions: the whole initial state, and the final position
+        from scipy.sparse import coo_matrix
+        from scipy.optimize import LinearConstraint
+        sdim, n = self._dynamics.sdim, self.n
+        cols = np.hstack((np.arange(sdim), n*sdim + np.arange(2)))
+        A = coo_matrix((np.ones(len(cols)), (np.arange(len(cols)), cols)), shape=(len(cols), len(x))).tocsr()
+        b = np.hstack((self.s0, self.mission.target))
+        return LinearConstraint(A, b, b)
+
+    def solve(self, controls=None, times=None, maxiter=500, tol=1e-6, verbose=0):
+
+        '''
+        Solve from the given controls and times, or the straight line to
+        the target, with scipy's trust-constr, to optimality and step
+        tolerance tol. Returns piecewise-constant controls of shape (n,)
+        and times of shape (n + 1,) for Mission.simulate.
+        '''
+
+        from scipy.optimize import minimize, NonlinearConstraint, Bounds
+
+        x0 = self.guess(controls, times)
+        sdim, n = self._dynamics.sdim, self.n
+
+        # bounded controls and positive final time, other variables free
+        lb = np.full(len(x0), -np.inf)
+        ub = np.full(len(x0), np.inf)
+        lb[(n + 1)*sdim:-1], ub[(n + 1)*sdim:-1] = -self.umax, self.umax
+        lb[-1] = 1e-3
+
+        # clearance margin, relaxed near the ends, which may lie closer to
+        # walls or obstacles, by the 1-Lipschitz bound along the straight line
+        L = np.linalg.norm(self.mission.target - self.mission.origin)
+        c0, cf = self._environment.clearance(np.vstack((self.mission.origin, self.mission.target)))
+        s = np.linspace(0, L, n + 1)
+        margin = np.minimum(self.margin, np.minimum(c0 + s, cf + L - s))
+
+        # dynamics, clearance, and boundary constraints
+        constraints = [
+            NonlinearConstraint(self.defects, 0, 0, jac=self.defects_jac, hess=self.defects_hess),
+            NonlinearConstraint(self.clearance, margin, np.inf, jac=self.clearance_jac, hess=self.clearance_hess),
+            self.boundary(x0)
+        ]
+
+        self.result = minimize(
+            self.cost,
+            x0,
+            jac=self.cost_grad,
+            hess=self.cost_hess,
+            method='trust-constr',
+            constraints=constraints,
+            bounds=Bounds(lb, ub),
+            options=dict(maxiter=maxiter, gtol=tol, xtol=tol, verbose=verbose, sparse_jacobian=True)
+        )
+
+        return self.solution()
+
+    def solution(self):
+
+        # controls over each interval, and knot times
+        S, u, tf = self.unpack(self.result.x)
+        return u, np.linspace(0, tf, self.n + 1)
@@ -2,6 +2,7 @@
 # sprague@kth.se
 
 import numpy as np
+from . import backend
 
 class Dynamics(object):
 
@@ -10,12 +11,15 @@ class Dynamics(object):
     u ∈ [-1, 1], determines the steering angle.
     '''
 
-    def __init__(self, length, speed):
+    def __init__(self, length, speed, umax=1):
 
         # car length [m]
         self.l = float(length)
         self.v = float(speed)
 
+        # maximum steering angle [rad]
+        self.umax = float(umax)
+
         # state and control dimensions
         self.sdim = 3
         self.udim = 1
@@ -25,18 +29,22 @@ class Dynamics(object):
 
     def eom_state(self, state, control):
 
+        # compiled for float states of shape (3,) or (3, n) under one control, if selected
+        if backend.active() and np.ndim(control) == 0 and isinstance(state, np.ndarray) and state.ndim <= 2 and state.dtype == float:
+            return backend.eom(state.reshape(3, -1), float(control), self.v, self.l).reshape(state.shape)
+
         # extract state
         x, y, theta = state
 
         # extract control
         phi = control
 
-        # return state transition
-        return np.array([
+        # return state transition, broadcast over batches
+        return np.array(np.broadcast_arrays(
             self.v*np.cos(theta),
             self.v*np.sin(theta),
             np.tan(phi)/self.l
-        ], float)
+        ), float)
 
     def eom_state_jac(self, state, control):
 
@@ -46,11 +54,32 @@ class Dynamics(object):
         # extract control
         u = control
 
-        # return state transition Jacobian
+        # zeros shaped like a batch of states
+        z = np.zeros(np.shape(theta))
+
+        # return state transition Jacobian, of shape (3, 3) plus any batch shape
+        return np.array([
+            [z, z, -self.v*np.sin(theta)],
+            [z, z,  self.v*np.cos(theta)],
+            [z, z,                     z]
+        ], float)
+
+    def eom_control_jac(self, state, control):
+
+        # extract state
+        x, y, theta = state
+
+        # extract control
+        phi = control
+
+        # zeros shaped like a batch of states and controls
+        z = np.zeros(np.broadcast(theta, phi).shape)
+
+        # return control transition Jacobian, of shape (3, 1) plus any batch shape
         return np.array([
-            [0, 0, -np.sin(theta)],
-            [0, 0,  np.cos(theta)],
-            [0, 0,              0]
+            [z],
+            [z],
+            [z + 1/(self.l*np.cos(phi)**2)]
         ], float)
 
 class Dynamics_2nd(object):
@@ -70,6 +99,9 @@ class Dynamics_2nd(object):
         # homotopy parameter
         self.alpha = float(alpha)
 
+        # constant speed
+        self.v = 1.0
+
         # state and control dimensions
         self.sdim = 5
         self.udim = 1
@@ -82,14 +114,14 @@ class Dynamics_2nd(object):
         # extract control
         u = control
 
-        # return state transition
-        return np.array([
+        # return state transition, broadcast over batches
+        return np.array(np.broadcast_arrays(
             np.cos(theta),
             np.sin(theta),
             np.tan(phi)/self.l,
             omega,
             u
-        ], float)
+        ), float)
 
     def eom_state_jac(self, state, control):
 
@@ -99,15 +131,34 @@ class Dynamics_2nd(object):
         # extract control
         u = control
 
-        # return state transition jacobian
+        # zeros and ones shaped like a batch of states
+        z = np.zeros(np.broadcast(theta, phi).shape)
+        o = z + 1
+
+        # return state transition jacobian, of shape (5, 5) plus any batch shape
         return np.array([
-            [0, 0, -np.sin(theta), 0,                         0],
-            [0, 0, np.cos(theta),  0,                         0],
-            [0, 0, 0,              1/(self.l*np.cos(phi)**2), 0],
-            [0, 0, 0,              0,                         1],
-            [0, 0, 0,              0,                         0]
+            [z, z, -np.sin(theta)+z, z,                           z],
+            [z, z,  np.cos(theta)+z, z,                           z],
+            [z, z, z,                1/(self.l*np.cos(phi)**2)+z, z],
+            [z, z, z,                z,                           o],
+            [z, z, z,                z,                           z]
         ], float)
 
+    def eom_control_jac(self, state, control):
+
+        # extract state
+        x, y, theta, phi, omega = state
+
+        # extract control
+        u = control
+
+        # zeros and ones shaped like a batch of states and controls
+        z = np.zeros(np.broadcast(theta, u).shape)
+        o = z + 1
+
+        # return control transition jacobian, of shape (5, 1) plus any batch shape
+        return np.array([[z], [z], [z], [z], [o]], float)
+
     def lagrangian(self, control):
 
         # extract control
@@ -125,7 +176,7 @@ class Dynamics_2nd(object):
         u = control
 
         # return hamiltonian
-        return (ltheta*np.tan(phi) + l*(self.alpha*u + lomega*u + lphi*omega + lx*np.cos(theta) + ly*np.sin(theta) + u**2*(-self.alpha + 1)))/self.l
+        return (ltheta*np.tan(phi) + self.l*(self.alpha*u + lomega*u + lphi*omega + lx*np.cos(theta) + ly*np.sin(theta) + u**2*(-self.alpha + 1)))/self.l
 
     def eom_fullstate(self, fullstate, control):
 
@@ -140,8 +191,8 @@ class Dynamics_2nd(object):
         x1 = np.sin(theta)
         x2 = 1/self.l
 
-        # return fullstate transition
-        return np.array([
+        # return fullstate transition, broadcast over batches
+        return np.array(np.broadcast_arrays(
             x0,
             x1,
             x2*np.tan(phi),
@@ -152,7 +203,7 @@ class Dynamics_2nd(object):
             lx*x1 - ly*x0,
             -ltheta*x2/np.cos(phi)**2,
             -lphi
-        ], float)
+        ), float)
 
     def eom_fullstate_jac(self, fullstate, control):
 
@@ -165,20 +216,24 @@ class Dynamics_2nd(object):
         # common subexpression elimination
         x0 = np.sin(theta)
         x1 = np.cos(theta)
-        x2 = 1/(l*np.cos(phi)**2)
+        x2 = 1/(self.l*np.cos(phi)**2)
+
+        # zeros and ones shaped like a batch of states
+        z = np.zeros(np.broadcast(theta, phi, lx, ly, ltheta).shape)
+        o = z + 1
 
-        # return fullstate transition jacobian
+        # return fullstate transition jacobian, of shape (10, 10) plus any batch shape
         return np.array([
-            [0, 0,           -x0,                        0, 0,  0,   0,   0,  0, 0],
-            [0, 0,            x1,                        0, 0,  0,   0,   0,  0, 0],
-            [0, 0,             0,                       x2, 0,  0,   0,   0,  0, 0],
-            [0, 0,             0,                        0, 1,  0,   0,   0,  0, 0],
-            [0, 0,             0,                        0, 0,  0,   0,   0,  0, 0],
-            [0, 0,             0,                        0, 0,  0,   0,   0,  0, 0],
-            [0, 0,             0,                        0, 0,  0,   0,   0,  0, 0],
-            [0, 0, lx*x1 + ly*x0,                        0, 0, x0, -x1,   0,  0, 0],
-            [0, 0,             0, -2*ltheta*x2*np.tan(phi), 0,  0,   0, -x2,  0, 0],
-            [0, 0,             0,                        0, 0,  0,   0,   0, -1, 0]
+            [z, z,           -x0+z,                        z, z,  z,   z,   z,  z, z],
+            [z, z,            x1+z,                        z, z,  z,   z,   z,  z, z],
+            [z, z,               z,                     x2+z, z,  z,   z,   z,  z, z],
+            [z, z,               z,                        z, o,  z,   z,   z,  z, z],
+            [z, z,               z,                        z, z,  z,   z,   z,  z, z],
+            [z, z,               z,                        z, z,  z,   z,   z,  z, z],
+            [z, z,               z,                        z, z,  z,   z,   z,  z, z],
+            [z, z, lx*x1 + ly*x0+z,                        z, z, x0+z, -x1+z, z,  z, z],
+            [z, z,               z, -2*ltheta*x2*np.tan(phi)+z, z,  z,   z, -x2+z, z, z],
+            [z, z,               z,                        z, z,  z,   z,   z, -o, z]
         ], float)
 
     def pontryagin(self, fullstate):
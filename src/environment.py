@@ -1,13 +1,15 @@
 # Christopher Iliffe Sprague
 # christopher.iliffe.sprague@gmail.com
 
-import numpy as np, matplotlib.pyplot as plt
-from .obstacle import Obstacle
-from . import util
+import os, numpy as np
+from .obstacle import ObstacleSet
+from .grid import Grid, poisson
+from .cache import LRU
+from . import util, backend
 
 class Environment(object):
 
-    def __init__(self, lx, ly, d, n):
+    def __init__(self, lx, ly, d, n, res=0.25, seed=None, rng=None):
 
         # area dimensions
         self.lx = float(lx)
@@ -25,8 +27,13 @@ class Environment(object):
         # safe radius
         self.d = float(d)
 
+        # random number generator, seeded from numpy's global state by default
+        if rng is None:
+            rng = np.random.default_rng(np.random.randint(2**31) if seed is None else seed)
+        self.rng = rng
+
         # random origin and target
-        y0 = np.random.uniform(0 + self.d, self.ly - self.d)
+        y0 = self.rng.uniform(0 + self.d, self.ly - self.d)
         if y0 <= self.ly/2:
             y1 = (y0 + self.ly)/2
         elif y0 > self.ly/2:
@@ -37,6 +44,12 @@ class Environment(object):
         # number of obstacles
         self.nobs = n
 
+        # signed distance raster resolution
+        self.res = float(res)
+
+        # memo of safety queries, off by default
+        self.cache = None
+
         # generate obstacles
         self.gen_obs()
 
@@ -49,85 +62,380 @@ class Environment(object):
         xl, xu = self.lx/10 + dub, 9*self.lx/10 - dub
         yl, yu = 0, self.ly
 
-        # obstacle list
-        self.obs = list()
-
-        # unsucessfull tries
-        i, j = 0, 0
-        # first obstacle
-        first = True
         # diameter bounds
         dlb, dub = self.d*2, self.d*6
         # number of vertices per obstacle
         n = 10
 
-        while i < self.nobs  and j < 10000:
+        # centres keeping obstacles apart, in random order
+        r = dub + self.d
+        pts = poisson([xl, yl], [xu, yu], r, self.rng)
+        pts = pts[self.rng.permutation(len(pts))]
+
+        # obstacles with every vertex within the area
+        obset = ObstacleSet.random(pts, dlb, dub, n, self.rng)
+        verts = obset.verts.reshape(len(pts), n, 2)
+        inside = ((verts >= 0) & (verts <= [self.lx, self.ly])).all(axis=(1, 2))
+        verts, pts = verts[inside][:self.nobs], pts[inside][:self.nobs]
+        verts, pts = list(verts), list(pts)
+
+        # fill gaps left by rejected obstacles with random placements, as many
+        # as rejection sampling would place, stopping after 10000 failures in a row
+        j = 0
+        while len(pts) < self.nobs and j < 10000:
+
+            # batch of proposed obstacles, within the area and apart from those placed
+            c = self.rng.uniform([xl, yl], [xu, yu], (256, 2))
+            v = ObstacleSet.random(c, dlb, dub, n, self.rng).verts.reshape(len(c), n, 2)
+            ok = ((v >= 0) & (v <= [self.lx, self.ly])).all(axis=(1, 2))
+            if len(pts) > 0:
+                ok &= (np.linalg.norm(c[:, None] - np.array(pts)[None], axis=2) > r).all(axis=1)
+
+            # place them in turn, apart from each other
+            k = len(pts)
+            for i in range(len(c)):
+                if ok[i] and (len(pts) == k or (np.linalg.norm(np.array(pts[k:]) - c[i], axis=1) > r).all()):
+                    verts.append(v[i])
+                    pts.append(c[i])
+                    j = 0
+                else:
+                    j += 1
+                if len(pts) >= self.nobs or j >= 10000:
+                    break
+
+        # obstacle arrays, and spatial index for batch queries
+        m = len(pts)
+        self._index(ObstacleSet(
+            np.reshape(verts, (-1, 2)), n*np.arange(m + 1),
+            np.reshape(pts, (-1, 2)), np.tile([dlb, dub], (m, 1))
+        ))
 
-            # random position
-            x = np.random.uniform(xl, xu)
-            y = np.random.uniform(yl, yu)
+    def _index(self, obset=None):
 
-            # proposed obstacle
-            pob = Obstacle(x, y, dlb, dub, n)
+        # obstacle arrays, from the obstacle list unless given
+        if obset is None:
+            obset = ObstacleSet.from_obstacles(self.obs)
+        self.obset = obset
 
-            # if first
-            if first:
-                self.obs.append(pob)
-                first = False
-                i += 1
+        # obstacle list, as views of the arrays
+        self.obs = list(self.obset)
 
-            else:
+        # boundary edges
+        self._bedges = np.stack((self.perim[:-1], self.perim[1:]), axis=1)
 
-                # check conflictions with other obstacles
-                if any([np.linalg.norm(pob.p - sob.p) <= pob.rub + sob.rub + self.d for sob in self.obs]):
-                    j += 1
-                # check if within boundaries
-                elif any(pob.verts[:,0] < 0) or any(pob.verts[:,0] > self.lx) or any(pob.verts[:,1] < 0) or any(pob.verts[:,1] > self.ly):
-                    j += 1
-                else:
-                    self.obs.append(pob)
-                    i += 1
-                    j = 0
+        # uniform grid over obstacle bounding circles
+        self.grid = Grid(self.lx, self.ly, self.obset.centres, self.obset.rub)
 
-    def safe(self, pts):
+        # grid and obstacle arrays, as taken by the compiled queries
+        self._arrays = (
+            self.grid.size, self.grid.nx, self.grid.ny, self.grid.start, self.grid.items,
+            self.grid.centres, self.grid.radii, self.obset.verts, self.obset.offsets
+        )
 
-        # if given points
-        if pts.ndim == 1:
+        # invalidate signed distance raster, and memoised safety queries
+        self._raster = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def memoize(self, size=65536, quantum=1e-6):
+
+        # memoise safety queries on endpoints rounded to quantum, or stop if size is None
+        self.cache = None if size is None else LRU(size, quantum)
+        return self.cache
+
+    def _memo(self, tag, rows, compute):
+
+        # safety of each row, through the memo if enabled
+        if self.cache is None:
+            return compute(rows)
+        return np.asarray(self.cache.lookup(tag, rows, compute), bool)
+
+    def distance(self, pts):
+
+        # points of shape (n, 2)
+        pts = np.asarray(pts, float).reshape(-1, 2)
+        x, y = pts[:, 0], pts[:, 1]
+
+        # signed distance to boundaries, negative outside
+        dist = np.min([x, self.lx - x, y, self.ly - y], axis=0)
+        if len(self.obs) == 0:
+            return dist
+
+        # bounds on the distance to each obstacle's boundary
+        c, r = self.grid.centres, self.grid.radii
+        dc = np.sqrt(((pts[:, None, :] - c[None])**2).sum(axis=2))
+        lb = dc - r
+        ub = (dc + r).min(axis=1)
+
+        # obstacles that may hold the closest edge
+        q, o = np.nonzero(lb <= ub[:, None])
+
+        # closest edge distance over candidate obstacles
+        de = self.obset.distances(pts, q, o)
+        n = np.bincount(q, minlength=len(pts))
+        dobs = np.minimum.reduceat(de, np.cumsum(n) - n)
+
+        # negative inside obstacles
+        inside = ~self.safe_points(pts) & (dist >= 0)
+        dobs[inside] *= -1
+
+        return np.minimum(dist, dobs)
+
+    def raster(self):
+
+        # cached signed distance field and packed occupancy bitmap
+        if self._raster is not None and self._raster[0] == self.res:
+            return self._raster[1:]
+
+        # grid nodes spanning the area
+        nx = int(np.ceil(self.lx/self.res)) + 1
+        ny = int(np.ceil(self.ly/self.res)) + 1
+        X, Y = np.meshgrid(np.linspace(0, self.lx, nx), np.linspace(0, self.ly, ny))
+        pts = np.column_stack((X.ravel(), Y.ravel()))
+
+        # signed distance at nodes, in chunks to bound memory
+        sdf = np.concatenate([
+            self.distance(pts[i:i + 4096])
+            for i in range(0, len(pts), 4096)
+        ]).reshape(ny, nx)
+
+        # occupied nodes, packed along rows
+        occ = np.packbits(sdf < 0, axis=1)
+
+        self._raster = (self.res, sdf, occ)
+        return sdf, occ
+
+    def clearance(self, pts, grad=False):
+
+        # points of shape (n, 2)
+        pts = np.asarray(pts, float).reshape(-1, 2)
+        sdf, occ = self.raster()
+        ny, nx = sdf.shape
+
+        # points outside the area are looked up at the closest border point
+        cpts = np.clip(pts, 0, [self.lx, self.ly])
+        out = np.linalg.norm(pts - cpts, axis=1)
+
+        # fractional node coordinates
+        u = cpts[:, 0]*(nx - 1)/self.lx
+        v = cpts[:, 1]*(ny - 1)/self.ly
+        i = np.clip(np.floor(np.nan_to_num(u)), 0, nx - 2).astype(int)
+        j = np.clip(np.floor(np.nan_to_num(v)), 0, ny - 2).astype(int)
+        u, v = u - i, v - j
+
+        # bilinear interpolation, less the distance outside
+        c = (
+            sdf[j, i]*(1 - u)*(1 - v) + sdf[j, i + 1]*u*(1 - v) +
+            sdf[j + 1, i]*(1 - u)*v + sdf[j + 1, i + 1]*u*v
+        ) - out
+        if not grad:
+            return c
+
+        # gradient of the interpolant within the area, of shape (n, 2)
+        g = np.column_stack((
+            ((sdf[j, i + 1] - sdf[j, i])*(1 - v) + (sdf[j + 1, i + 1] - sdf[j + 1, i])*v)*(nx - 1)/self.lx,
+            ((sdf[j + 1, i] - sdf[j, i])*(1 - u) + (sdf[j + 1, i + 1] - sdf[j, i + 1])*u)*(ny - 1)/self.ly
+        ))
+
+        # clipped coordinates only move the distance outside
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g = np.where(pts != cpts, np.nan_to_num((cpts - pts)/out[:, None]), g)
+
+        return c, g
+
+    def _margin(self):
+
+        # worst case interpolation error of a 1-Lipschitz field
+        ny, nx = self.raster()[0].shape
+        return np.hypot(self.lx/(nx - 1), self.ly/(ny - 1))*(1 + 1e-9)
+
+    def clear_paths(self, pts, margin, skip=None):
 
-            # check if within boundaries
-            if pts[0] < 0 or pts[0] > self.lx or pts[1] < 0 or pts[1] > self.ly:
-                return False
+        '''
+        Whether each of n paths, sampled as points of shape (n, m, 2), stays
+        more than margin from obstacles and boundaries at every point but
+        those masked by skip, of shape (n, m). Points are decided from the
+        raster away from the margin, and exactly near it, only on paths
+        the raster has not already ruled out.
+        '''
 
-            # check if inside obstacles
-            for ob in self.obs:
+        # points of shape (n, m, 2), none skipped by default
+        pts = np.asarray(pts, float)
+        n, m = pts.shape[:2]
+        if skip is None:
+            skip = np.zeros((n, m), bool)
 
-                if ob.point_inside(pts):
-                    return False
+        # clearance from the raster, and its worst case error
+        c, e = self.clearance(pts.reshape(-1, 2)).reshape(n, m), self._margin()
+        clear = skip | (c > margin + e)
+        ok = ~(~skip & (c < margin - e)).any(axis=1)
+
+        # exact distances of undecided points on the remaining paths
+        near = ~clear & ok[:, None]
+        if near.any():
+            clear[near] = self.distance(pts[near]) > margin
+
+        return ok & clear.all(axis=1)
+
+    def safe_points(self, pts, fast=False):
+
+        # points of shape (n, 2)
+        pts = np.asarray(pts, float).reshape(-1, 2)
+        return self._memo('points', pts, lambda pts: self._safe_points(pts, fast))
+
+    def _safe_points(self, pts, fast=False):
+
+        # decide from the raster away from obstacle boundaries
+        if fast:
+            c, m = self.clearance(pts), self._margin()
+            safe = c > m
+            near = ~safe & ~(c < -m)
+            safe[near] = self._safe_points(pts[near])
+            return safe
+
+        # compiled loops over the grid's candidates if selected
+        if backend.active():
+            return backend.safe_points(pts, self.lx, self.ly, *self._arrays)
+
+        x, y = pts[:, 0], pts[:, 1]
+
+        # check if within boundaries
+        safe = ~((x < 0) | (x > self.lx) | (y < 0) | (y > self.ly))
+
+        # candidate (point, obstacle) pairs near each point
+        q, o = self.grid.query_points(pts)
+        if len(q) == 0:
+            return safe
+
+        # test each pair against its obstacle's polygon
+        safe[q[self.obset.contains(pts, q, o)]] = False
+
+        return safe
+
+    def safe_segments(self, segs, fast=False):
+
+        # segments of shape (n, 2, 2)
+        segs = np.asarray(segs, float).reshape(-1, 2, 2)
+        return self._memo('segments', segs, lambda segs: self._safe_segments(segs, fast))
+
+    def _safe_segments(self, segs, fast=False):
+
+        # accept segments that provably stay in free space
+        if fast:
+            c = self.clearance(segs.reshape(-1, 2)).reshape(-1, 2).min(axis=1)
+            L = np.linalg.norm(segs[:, 1] - segs[:, 0], axis=1)
+            safe = c - L/2 > self._margin()
+            safe[~safe] = self._safe_segments(segs[~safe])
+            return safe
+
+        # compiled loops over the grid's candidates if selected
+        if backend.active():
+            return backend.safe_segments(segs, self._bedges, *self._arrays)
+
+        # check if intersecting boundaries
+        safe = ~util.intersections(segs[:, None], self._bedges[None]).any(axis=1)
+
+        # candidate (segment, obstacle) pairs near each segment
+        q, o = self.grid.query_segments(segs)
+        if len(q) == 0:
+            return safe
+
+        # check if it intersect obstacle edges
+        safe[q[self.obset.intersects(segs, q, o)]] = False
+
+        return safe
+
+    def safe_arcs(self, arcs):
+
+        # arcs of shape (n, 5), as start pose (x, y, theta), curvature, and length
+        arcs = np.asarray(arcs, float).reshape(-1, 5)
+        return self._memo('arcs', arcs, self._safe_arcs)
+
+    def _safe_arcs(self, arcs):
+
+        # check if intersecting boundaries
+        safe = ~util.arc_intersections(arcs[:, None], self._bedges[None]).any(axis=1)
+
+        # discs around the middle of each arc, half its length in radius, contain it
+        s = arcs[:, 4]/2
+        theta = arcs[:, 2] + arcs[:, 3]*s/2
+        c = s*np.sinc(arcs[:, 3]*s/(2*np.pi))
+        mid = arcs[:, :2] + c[:, None]*np.column_stack((np.cos(theta), np.sin(theta)))
+
+        # candidate (arc, obstacle) pairs near each arc
+        q, o = self.grid.query_discs(mid, np.abs(s)*(1 + 1e-9))
+        if len(q) == 0:
+            return safe
+
+        # check if it intersect obstacle edges
+        safe[q[self.obset.arc_intersects(arcs, q, o)]] = False
+
+        return safe
+
+    def safe(self, pts, fast=False):
+
+        # if given points
+        if pts.ndim == 1:
+            return bool(self.safe_points(pts, fast)[0])
 
         # if given segment
         if pts.shape == (2, 2):
+            return bool(self.safe_segments(pts, fast)[0])
 
-            # check if intersecting boundaries
-            for i in range(4):
+        return True
 
-                # boundary line
-                perim = self.perim[i:i+2, :]
+    @staticmethod
+    def _archive(path):
 
-                if util.intersection(pts, perim):
-                    return False
+        # path with the .npz suffix np.savez appends
+        path = os.fspath(path)
+        return path if path.endswith('.npz') else path + '.npz'
 
-            # check if it intersect obstacle edges
-            for ob in self.obs:
+    def save(self, path):
 
-                if ob.line_intersect(pts):
-                    return False
+        # obstacles as one vertex array delimited by offsets
+        np.savez(
+            self._archive(path),
+            area=np.array([self.lx, self.ly, self.d, self.res]),
+            nobs=self.nobs,
+            p0=self.p0,
+            pf=self.pf,
+            verts=self.obset.verts,
+            offsets=self.obset.offsets,
+            centres=self.obset.centres,
+            bounds=self.obset.bounds
+        )
 
-        return True
+    @classmethod
+    def load(cls, path, seed=None, rng=None):
+
+        with np.load(cls._archive(path)) as data:
+
+            # environment without generating obstacles
+            env = cls.__new__(cls)
+            env.lx, env.ly, env.d, env.res = map(float, data['area'])
+            env.perim = np.array([[0, 0], [env.lx, 0], [env.lx, env.ly], [0, env.ly], [0, 0]], float)
+            env.nobs = int(data['nobs'])
+            env.p0, env.pf = data['p0'], data['pf']
+
+            # generator for regenerating obstacles
+            env.rng = np.random.default_rng(seed) if rng is None else rng
+
+            # memo of safety queries, off by default
+            env.cache = None
+
+            # obstacle arrays
+            obset = ObstacleSet(data['verts'], data['offsets'], data['centres'], data['bounds'])
+
+        # spatial index for batch queries
+        env._index(obset)
 
+        return env
 
     def plot(self, ax=None, voronoi=False):
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots(1)
 
         # plot walls
@@ -180,4 +488,5 @@ if __name__ == '__main__':
             ax.plot(*res, 'kx')
             ax.plot(line[:,0], line[:,1],'k-')
 
+    import matplotlib.pyplot as plt
     plt.show()
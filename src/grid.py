@@ -0,0 +1,175 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+from . import util
+
+class Grid(object):
+
+    '''
+    Uniform grid over the bounding circles of obstacles, mapping each cell
+    to the obstacles that may overlap it. Queries return candidate
+    (query, obstacle) pairs that survive a bounding-circle test.
+    '''
+
+    def __init__(self, lx, ly, centres, radii, size=None):
+
+        # obstacle bounding circles, with slack for rounding in the vertices
+        self.centres = np.array(centres, float).reshape(-1, 2)
+        self.radii = np.array(radii, float).reshape(-1)*(1 + 1e-9)
+
+        # cell size defaults to the largest obstacle diameter
+        if size is None:
+            size = 2*self.radii.max() if len(self.radii) > 0 else max(lx, ly)
+        self.size = float(size)
+
+        # number of cells
+        self.nx = max(int(np.ceil(lx/self.size)), 1)
+        self.ny = max(int(np.ceil(ly/self.size)), 1)
+
+        # (obstacle, cell) pairs over each circle's bounding box
+        obs, cells = self._boxes(self.centres - self.radii[:, None], self.centres + self.radii[:, None])
+
+        # compressed cell to obstacle table
+        order = np.argsort(cells, kind='stable')
+        self.items = obs[order]
+        self.start = np.searchsorted(cells[order], np.arange(self.nx*self.ny + 1))
+
+    def cell(self, pts):
+
+        # clipped cell coordinates of (n, 2) points
+        ij = np.floor(np.asarray(pts, float)/self.size)
+        ij = np.nan_to_num(ij, nan=0, posinf=max(self.nx, self.ny), neginf=0)
+        return np.clip(ij, 0, [self.nx - 1, self.ny - 1]).astype(int)
+
+    def _boxes(self, lo, hi):
+
+        # cells spanned by each box
+        lo, hi = self.cell(lo), self.cell(hi)
+        w, h = hi[:, 0] - lo[:, 0] + 1, hi[:, 1] - lo[:, 1] + 1
+
+        # enumerate (box, cell) pairs
+        q = np.repeat(np.arange(len(lo)), w*h)
+        k = util.ranges(np.zeros(len(lo), int), w*h)
+        return q, (lo[q, 1] + k//w[q])*self.nx + lo[q, 0] + k%w[q]
+
+    def _candidates(self, q, cells):
+
+        # expand (query, cell) pairs into (query, obstacle) pairs
+        counts = self.start[cells + 1] - self.start[cells]
+        return np.repeat(q, counts), self.items[util.ranges(self.start[cells], counts)]
+
+    def _unique(self, q, cells):
+
+        # unique (query, obstacle) pairs over several cells
+        q, o = self._candidates(q, cells)
+        n = max(len(self.radii), 1)
+        pair = np.unique(q*n + o)
+        return pair//n, pair%n
+
+    def query_points(self, pts):
+
+        # candidates from the cell of each point
+        ij = self.cell(pts)
+        q, o = self._candidates(np.arange(len(pts)), ij[:, 1]*self.nx + ij[:, 0])
+
+        # bounding circle reject
+        d = pts[q] - self.centres[o]
+        keep = d[:, 0]**2 + d[:, 1]**2 <= self.radii[o]**2
+
+        return q[keep], o[keep]
+
+    def query_segments(self, segs):
+
+        # unique candidates over each segment's bounding box
+        q, o = self._unique(*self._boxes(segs.min(axis=1), segs.max(axis=1)))
+
+        # bounding circle reject, by distance from centre to segment
+        p0, p1, c = segs[q, 0], segs[q, 1], self.centres[o]
+        d = p1 - p0
+        dd = d[:, 0]**2 + d[:, 1]**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = ((c - p0)*d).sum(axis=1)/dd
+        t = np.clip(np.nan_to_num(t), 0, 1)
+        r = p0 + t[:, None]*d - c
+        keep = r[:, 0]**2 + r[:, 1]**2 <= self.radii[o]**2
+
+        return q[keep], o[keep]
+
+    def query_discs(self, centres, radii):
+
+        # unique candidates over each disc's bounding box
+        q, o = self._unique(*self._boxes(centres - radii[:, None], centres + radii[:, None]))
+
+        # bounding circle reject
+        d = centres[q] - self.centres[o]
+        keep = d[:, 0]**2 + d[:, 1]**2 <= (radii[q] + self.radii[o])**2
+
+        return q[keep], o[keep]
+
+def poisson(lo, hi, r, rng, k=30):
+
+    '''
+    Maximal set of points in the box [lo, hi] no closer than r to each
+    other, by Bridson's Poisson-disk sampling. A background grid with
+    cells of side r/sqrt(2) holds at most one point per cell, so each
+    candidate is checked against a fixed neighbourhood of cells.
+    '''
+
+    lo, hi = np.array(lo, float), np.array(hi, float)
+    if (hi < lo).any():
+        return np.empty((0, 2), float)
+
+    # background grid of point indices
+    size = r/np.sqrt(2)
+    nx, ny = (np.floor((hi - lo)/size).astype(int) + 1)
+    cells = np.full((ny + 4, nx + 4), -1, int)
+
+    # neighbourhood of cells within r
+    di, dj = np.meshgrid(np.arange(-2, 3), np.arange(-2, 3))
+    di, dj = di.ravel(), dj.ravel()
+
+    # at most one point per cell
+    pts = np.empty((nx*ny + 1, 2), float)
+    n, active = 0, list()
+
+    # first point anywhere in the box
+    p = rng.uniform(lo, hi)
+
+    while True:
+
+        # place point
+        if p is not None:
+            i, j = ((p - lo)/size).astype(int) + 2
+            cells[j, i] = n
+            pts[n] = p
+            active.append(n)
+            n += 1
+
+        if len(active) == 0:
+            break
+
+        # random active point
+        a = int(rng.integers(len(active)))
+
+        # k candidates in the annulus between r and 2r around it
+        rho = r*np.sqrt(rng.uniform(1 + 1e-9, 4, k))
+        phi = rng.uniform(0, 2*np.pi, k)
+        c = pts[active[a]] + rho[:, None]*np.column_stack((np.cos(phi), np.sin(phi)))
+        c = c[((c >= lo) & (c <= hi)).all(axis=1)]
+
+        # points in the neighbourhood of each candidate
+        ij = ((c - lo)/size).astype(int) + 2
+        near = cells[ij[:, 1, None] + dj, ij[:, 0, None] + di]
+        d = pts[np.maximum(near, 0)] - c[:, None]
+        ok = np.flatnonzero(((near < 0) | (d[..., 0]**2 + d[..., 1]**2 > r**2)).all(axis=1))
+
+        # keep the first valid candidate, or retire the point
+        if len(ok) > 0:
+            p = c[ok[0]]
+        else:
+            p = None
+            active[a] = active[-1]
+            active.pop()
+
+    return pts[:n]
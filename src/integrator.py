@@ -0,0 +1,127 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+from . import backend
+
+class RK4(object):
+
+    '''
+    Fixed-step fourth order Runge-Kutta integrator, exposing the same
+    stepping interface as scipy's RK45 (t, y, direction, step, dense_output).
+    States are indexed along the first axis, so advance also propagates
+    (sdim, n) batches when fun is vectorized. An optional compiled
+    kernel(t, y, times), behaving as propagate, replaces the NumPy steps
+    when the numba backend is selected.
+    '''
+
+    def __init__(self, fun, t0, y0, max_step=0.05, kernel=None):
+
+        # state transition fun(t, y)
+        self.fun = fun
+
+        # compiled propagation
+        self.kernel = kernel
+
+        # step size
+        self.h = float(max_step)
+
+        # current and previous state and time
+        self.t = self.t_old = float(t0)
+        self.y = self.y_old = np.array(y0, float)
+
+        # integrate forward
+        self.direction = 1
+
+    def advance(self, t, y, h):
+
+        # compiled step if selected
+        if self.kernel is not None and backend.active():
+            return self.kernel(t, y, np.array([t + h]))[..., 0]
+
+        # one Runge-Kutta step of size h
+        k1 = self.fun(t, y)
+        k2 = self.fun(t + h/2, y + h/2*k1)
+        k3 = self.fun(t + h/2, y + h/2*k2)
+        k4 = self.fun(t + h, y + h*k3)
+        return y + h/6*(k1 + 2*k2 + 2*k3 + k4)
+
+    def step(self):
+
+        # store previous state and time
+        self.t_old, self.y_old = self.t, self.y
+
+        # take one step
+        self.y = self.advance(self.t, self.y, self.h)
+        self.t = self.t + self.h
+
+    def dense_output(self):
+
+        # state within the last step, by stepping from its start
+        return lambda t: self.advance(self.t_old, self.y_old, t - self.t_old)
+
+    def grid(self, t0, tf):
+
+        # step boundaries from t0 to tf
+        n = max(int(np.ceil((tf - t0)/self.h - 1e-9)), 1)
+        return np.append(t0 + self.h*np.arange(1, n), tf)
+
+    def propagate(self, t, y, times):
+
+        # compiled steps if selected
+        if self.kernel is not None and backend.active():
+            return self.kernel(t, y, np.asarray(times, float))
+
+        # states at each of times, stacked along a new last axis
+        y = np.asarray(y, float)[..., None]
+        states = list()
+        for ti in times:
+            y = self.advance(t, y, ti - t)
+            t = ti
+            states.append(y)
+
+        return np.concatenate(states, axis=-1)
+
+    def segment(self, tf):
+
+        # integrate to tf under the current control
+        times = self.grid(self.t, tf)
+        states = self.propagate(self.t, self.y, times).T
+
+        # store previous and current state and time
+        self.t_old, self.y_old = (times[-2], states[-2]) if len(times) > 1 else (self.t, self.y)
+        self.t, self.y = times[-1], states[-1]
+
+        return states, times
+
+class Arc(RK4):
+
+    '''
+    Exact integrator for models whose speed and turning rate are constant
+    under a constant control, such as Dynamics, where the car follows
+    circular arcs. The state is (x, y, theta).
+    '''
+
+    def advance(self, t, y, h):
+
+        # velocity and turning rate at the start of the arc
+        f = self.fun(t, y)
+        v, w = np.hypot(f[0], f[1]), f[2]
+
+        # heading at the middle of the arc
+        theta = y[2] + w*h/2
+
+        # chord length of the arc
+        c = v*h*np.sinc(w*h/(2*np.pi))
+
+        # state after h, broadcast over batches or durations
+        return np.array(np.broadcast_arrays(
+            y[0] + c*np.cos(theta),
+            y[1] + c*np.sin(theta),
+            y[2] + w*h
+        ), float)
+
+    def propagate(self, t, y, times):
+
+        # states at each of times at once, stacked along a new last axis
+        return self.advance(t, np.asarray(y, float)[..., None], np.asarray(times, float) - t)
@@ -0,0 +1,296 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import os, time, heapq, numpy as np
+from . import paths
+from .buffer import Buffer
+from .planner import Dubins
+
+class Primitives(object):
+
+    '''
+    Library of motion primitives of the Dubins car: constant steering
+    arcs turning by whole multiples of 2π/headings, so that from any of
+    the discrete headings they end on another. Their geometry is stored
+    once per start heading, relative to the start position, and reused
+    by translation: end offsets, states sampled at the mission's maximum
+    step as Mission.simulate samples them, and durations as costs. The
+    arrays are saved to, and loaded from, a single .npz archive.
+    '''
+
+    keys = ('controls', 'durations', 'turns', 'curvatures', 'ends', 'samples', 'params')
+
+    def __init__(self, controls, durations, turns, curvatures, ends, samples, params):
+
+        # steering angle, duration, heading index change, and curvature of each of p primitives
+        self.controls = controls
+        self.durations = durations
+        self.turns = turns
+        self.curvatures = curvatures
+
+        # end offsets of shape (headings, p, 2), and sampled states of shape (headings, p, m, 3),
+        # padded by repeating each primitive's final state
+        self.ends = ends
+        self.samples = samples
+
+        # headings, car length, speed, maximum steering, and sampling step, the build's parameters
+        self.params = params
+        self.headings = len(ends)
+
+    def __len__(self):
+        return len(self.controls)
+
+    @classmethod
+    def build(cls, dyn, headings=16, lengths=(1, 3), turns=2, step=0.05, cache=None):
+
+        '''
+        Primitives of each arc length in lengths turning by up to turns
+        heading increments either way, where the steering bound allows,
+        sampled every step in time. With a cache path, the library is
+        loaded from it when built with the same parameters, and saved to
+        it otherwise.
+        '''
+
+        # parameters identifying the library
+        params = np.hstack((headings, dyn.l, dyn.v, dyn.umax, step, turns, lengths)).astype(float)
+
+        # load if cached with the same parameters
+        if cache is not None and os.path.exists(cache):
+            prims = cls.load(cache)
+            if prims.params.shape == params.shape and np.allclose(prims.params, params):
+                return prims
+
+        # heading changes and arc lengths of every primitive
+        j, s = np.meshgrid(np.arange(-turns, turns + 1), np.asarray(lengths, float))
+        j, s = j.ravel(), s.ravel()
+        k = j*2*np.pi/headings/s
+
+        # steering angles, keeping those within bounds
+        u = np.arctan(k*dyn.l)
+        ok = np.abs(u) <= dyn.umax
+        j, s, k, u = j[ok], s[ok], k[ok], u[ok]
+        T = s/dyn.v
+
+        # sample times at the maximum step, ending on each primitive's duration, as Mission._simulate
+        n = np.maximum(np.ceil(T/step - 1e-9).astype(int), 1)
+        i = np.minimum(np.arange(n.max() + 1), n[:, None])
+        t = np.where(i == n[:, None], T[:, None], step*i)
+
+        # states along each primitive from the origin at every discrete heading
+        q = np.zeros((headings, 1, 1, 3))
+        q[..., 2] = 2*np.pi*np.arange(headings)[:, None, None]/headings
+        samples = paths.arc(q, k[:, None], dyn.v*t)
+        ends = samples[:, np.arange(len(k)), n, :2]
+
+        prims = cls(u, T, j, k, ends, samples, params)
+        if cache is not None:
+            prims.save(cache)
+
+        return prims
+
+    def save(self, path):
+
+        # single archive
+        np.savez(path, **{key: getattr(self, key) for key in self.keys})
+
+    @classmethod
+    def load(cls, path):
+
+        # whole arrays from an archive
+        with np.load(path) as data:
+            return cls(*[data[key] for key in cls.keys])
+
+class Lattice(Dubins):
+
+    '''
+    A* search over the car's heading-discretised state lattice, expanding
+    each node by every primitive at once, and collision checking them in
+    one batch with the clearance margin of Dubins paths. Nodes keep their
+    exact positions, and are pruned on (cell, heading) with cells of size
+    res. Nodes within reach of the target try Dubins paths to it, via
+    Dubins.goal_path, and the first collision free one whose plan passes
+    Mission.simulate ends the search. Costs are times, with the straight
+    line time to the target as heuristic, inflated by weight.
+    '''
+
+    def __init__(self, mission, prims=None, res=1.0, weight=1.2, reach=5, ds=0.05, margin=0.1, tol=0.01):
+
+        # mission, its environment, and dynamics
+        self.mission = mission
+        self._environment = mission._environment
+        self._dynamics = mission._dynamics
+
+        # primitives, sampled as the mission samples its steps
+        if prims is None:
+            prims = Primitives.build(self._dynamics, step=mission._max_step)
+        self.prims = prims
+
+        # pruning resolution, heuristic weight, and goal connection range
+        self.res = float(res)
+        self.weight = float(weight)
+        self.reach = float(reach)
+
+        # turning radius, collision checking resolution, clearance margin, and distance
+        # to stop short of the target
+        self.r = paths.radius(self._dynamics)
+        self.ds = float(ds)
+        self.margin = float(margin)
+        self.tol = float(tol)
+
+        # initialise search
+        self.reset()
+
+    def reset(self):
+
+        # nodes as (x, y, heading index), with their parents, costs, and incoming primitives
+        self.nodes   = Buffer((3,))
+        self.parents = Buffer((), dtype=int)
+        self.costs   = Buffer()
+        self.prim    = Buffer((), dtype=int)
+
+        # cheapest cost per (cell, heading), open heap of (estimate, node), and expansions
+        self._best = dict()
+        self._open = list()
+        self.expanded = 0
+
+        # root at the origin, heading 0
+        self._push(np.hstack((self.mission.origin, 0)), -1, 0, -1)
+
+        # goal connection as (node, word, segment lengths)
+        self.goal = None
+
+    def _key(self, node):
+        return (int(np.floor(node[0]/self.res)), int(np.floor(node[1]/self.res)), int(node[2]))
+
+    def _push(self, node, parent, cost, prim):
+
+        # skip nodes no cheaper than one already in their cell and heading
+        key = self._key(node)
+        if self._best.get(key, np.inf) <= cost:
+            return
+        self._best[key] = cost
+
+        # append node
+        self.nodes.append(node)
+        self.parents.append(parent)
+        self.costs.append(cost)
+        self.prim.append(prim)
+
+        # estimate of the total time to the target
+        h = np.linalg.norm(node[:2] - self.mission.target)/self._dynamics.v
+        heapq.heappush(self._open, (cost + self.weight*h, len(self.nodes) - 1))
+
+    def free_primitives(self, node):
+
+        # primitive samples from this node, of shape (p, m, 3)
+        k = int(node[2])
+        pts = self.prims.samples[k][..., :2] + node[:2]
+        p = len(pts)
+
+        # sampled points, spaced by the library's speed and step, clear by the margin as any path,
+        # all primitives at once
+        safe = self.clear(pts, self.prims.params[2]*self.prims.params[4])
+
+        # and the exact arcs, when the mission checks them
+        if self.mission.ccd:
+            arcs = np.column_stack((
+                np.tile(node[:2], (p, 1)),
+                np.full(p, 2*np.pi*k/self.prims.headings),
+                self.prims.curvatures,
+                self._dynamics.v*self.prims.durations
+            ))
+            safe[safe] = self._environment.safe_arcs(arcs[safe])
+
+        return safe
+
+    def expand(self, i):
+
+        # successors under every collision free primitive
+        node, cost = self.nodes.view()[i], self.costs.view()[i]
+        k = int(node[2])
+        self.expanded += 1
+        for j in np.flatnonzero(self.free_primitives(node)):
+            nxt = np.hstack((node[:2] + self.prims.ends[k, j], (k + self.prims.turns[j]) % self.prims.headings))
+            self._push(nxt, i, cost + self.prims.durations[j], j)
+
+    def connect(self, i):
+
+        # shortest collision free path to the goal, from nearby nodes
+        node = self.nodes.view()[i]
+        q = np.hstack((node[:2], 2*np.pi*node[2]/self.prims.headings))
+        path = self.goal_path(q, self.reach)
+        if path is None:
+            return False
+        self.goal = (i,) + path
+
+        return True
+
+    def plan(self, iters=100000, budget=None):
+
+        # wall clock limit
+        t0 = time.time()
+
+        for it in range(iters):
+
+            # cheapest open node, skipping those superseded in their cell
+            if len(self._open) == 0:
+                break
+            f, i = heapq.heappop(self._open)
+            if self._best[self._key(self.nodes.view()[i])] < self.costs.view()[i]:
+                continue
+
+            # stop at the first connection to the goal passing the mission's simulation
+            if self.connect(i):
+                if self.check(*self.solution()):
+                    break
+                self.goal = None
+            self.expand(i)
+
+            # stop when out of time
+            if budget is not None and time.time() - t0 > budget:
+                break
+
+        return self.solution()
+
+    def solution(self):
+
+        # no connection to the goal
+        if self.goal is None:
+            return None
+        i, word, L = self.goal
+
+        # primitives from the root
+        prims = list()
+        while self.parents.view()[i] >= 0:
+            prims.append(self.prim.view()[i])
+            i = self.parents.view()[i]
+        prims = np.array(prims[::-1], int)
+
+        # piecewise-constant controls and times, primitives then the goal connection
+        u, t = paths.controls(word, L, self._dynamics)
+        u = np.hstack((self.prims.controls[prims], u.ravel()))
+        dt = np.hstack((self.prims.durations[prims], np.diff(t, axis=1).ravel()))
+
+        # drop empty segments
+        keep = dt > 0
+        return u[keep], np.hstack((0, np.cumsum(dt[keep])))
+
+    def plot(self, ax=None):
+
+        if ax is None:
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots(1)
+
+        # expanded primitives from every node's parent
+        i = np.flatnonzero(self.parents.view() >= 0)
+        if len(i) > 0:
+            parents = self.nodes.view()[self.parents.view()[i]]
+            k = parents[:, 2].astype(int)
+            pts = self.prims.samples[k, self.prim.view()[i], :, :2] + parents[:, None, :2]
+            for p in pts:
+                ax.plot(p[:, 0], p[:, 1], 'k-', alpha=0.3, lw=0.5)
+
+        try:
+            return fig, ax
+        except:
+            pass
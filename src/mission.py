@@ -1,15 +1,18 @@
 # Christopher Iliffe Sprague
 # sprague@kth.se
 
-import numpy as np, matplotlib.pyplot as plt
-from scipy.integrate import RK45 as ODE
+import contextlib, numpy as np
 from .dynamics import Dynamics
+from .integrator import RK4, Arc
+from .buffer import Buffer
+from .records import Records
+from . import backend, stats, paths, util
 from .environment import Environment
 np.set_printoptions(suppress=True, precision=4)
 
 class Mission(object):
 
-    def __init__(self, dyn=None, env=None):
+    def __init__(self, dyn=None, env=None, integrator='rk45', max_step=0.05, ccd=False, events=False):
 
         if dyn is None:
             dyn = Dynamics(1, 1)
@@ -33,17 +36,50 @@ class Mission(object):
         # arbitrary control for integrator initialisation
         self._control = 0
 
+        # maximum integration step
+        self._max_step = float(max_step)
+
+        # check transitions as exact arcs rather than chords
+        if ccd and self._dynamics.sdim != 3:
+            raise ValueError('Continuous collision checking needs (x, y, theta) dynamics.')
+        self.ccd = bool(ccd)
+
         # numerical integrator
-        self._integrator = ODE(
-            self._eom,
-            0,
-            np.hstack((self.origin, np.zeros(self._dynamics.sdim - 2))),
-            1000,
-            atol=1e-8,
-            vectorized=True,
-            max_step=0.05,
-            #jac=self._jac
-        )
+        s0 = np.hstack((self.origin, np.zeros(self._dynamics.sdim - 2)))
+        if integrator == 'rk45':
+            from scipy.integrate import RK45 as ODE
+            self._integrator = ODE(
+                self._eom,
+                0,
+                s0,
+                1000,
+                atol=1e-8,
+                vectorized=True,
+                max_step=self._max_step,
+                #jac=self._jac
+            )
+            self._h0 = self._integrator.h_abs
+        elif integrator == 'rk4':
+            self._integrator = RK4(self._eom, 0, s0, max_step=self._max_step, kernel=self._kernel())
+        elif integrator == 'arc' and self._dynamics.sdim == 3:
+            self._integrator = Arc(self._eom, 0, s0, max_step=self._max_step)
+        else:
+            raise ValueError('Unsupported integrator {} for these dynamics.'.format(integrator))
+        self.integrator = integrator
+
+        # skip checks while far from everything, and locate the first event in a step
+        self.events = bool(events)
+
+        # bound on distance travelled per unit time, allowing for negative Runge-Kutta weights
+        self._speed = self._dynamics.v*np.abs(getattr(self._integrator, 'B', 1)).sum()
+
+        # growable records
+        self._states   = Buffer((self._dynamics.sdim,))
+        self._times    = Buffer()
+        self._controls = Buffer()
+
+        # opt-in counters and timers
+        self._stats = stats.Stats()
 
         # reset mission
         self.reset()
@@ -57,6 +93,14 @@ class Mission(object):
         # set numerical integrator state and time
         self._integrator.y = np.array(self.state, float)
         self._integrator.t = float(self.time)
+        self._restart()
+
+    def _restart(self):
+
+        # scipy's solvers reuse the derivative from the end of their last step,
+        # so evaluate it afresh at a new state or under a new control
+        if self.integrator == 'rk45':
+            self._integrator.f = self._integrator.fun(self._integrator.t, self._integrator.y)
 
     def reset(self):
 
@@ -64,20 +108,107 @@ class Mission(object):
         s0 = np.hstack((self.origin, np.zeros(self._dynamics.sdim - 2)))
         t0 = 0
 
-        # set to nominal conditions
+        # set to nominal conditions, with the solver's initial step size
+        if self.integrator == 'rk45':
+            self._integrator.h_abs = self._h0
         self.set(s0, t0)
 
         # reset records
-        self.states   = np.array([s0], float)
-        self.times    = np.array([t0], float)
-        self.controls = np.empty((1, 0), float)
+        self.states   = [s0]
+        self.times    = [t0]
+        self.controls = []
 
     def record(self, state, control, time):
 
         # record state, time, and control
-        self.states   = np.vstack((self.states, state))
-        self.times    = np.append(self.times, time)
-        self.controls = np.append(self.controls, control)
+        self._states.extend(state)
+        self._times.extend(time)
+        self._controls.extend(control)
+
+    def instrument(self, enabled=True):
+
+        # remove any instrumentation, rather than stacking it
+        self._stats.unwrap()
+        if not enabled:
+            return
+
+        # the dynamics and environment are instrumented as objects, so their
+        # phases also count calls from other missions or planners sharing them
+
+        # right hand side evaluations, over each state in a batch, and those
+        # within compiled Runge-Kutta steps, four per step over every state
+        sdim = self._dynamics.sdim
+        self._stats.wrap(self._dynamics, 'eom_state', 'eom', lambda state, control: np.size(state)//sdim)
+        self._stats.wrap(self, '_rk4', 'eom', lambda t, y, times: 4*len(times)*(np.size(y)//sdim), lambda t, y, times: 4*len(times))
+
+        # integrator steps, and states propagated in bulk
+        self._stats.wrap(self._integrator, 'step', 'step')
+        if hasattr(self._integrator, 'propagate'):
+            self._stats.wrap(self._integrator, 'propagate', 'propagate', stats.samples)
+
+        # collision queries, by number of points, segments, or arcs checked
+        self._stats.wrap(self._environment, 'safe_points', 'points', stats.points)
+        self._stats.wrap(self._environment, 'safe_segments', 'segments', stats.segments)
+        self._stats.wrap(self._environment, 'safe_arcs', 'arcs', stats.arcs)
+
+        # record appends, by number of states
+        self._stats.wrap(self, 'record', 'record', lambda state, control, time: np.size(time))
+
+    def stats(self):
+
+        # calls, elements, and inclusive seconds per phase
+        return self._stats.snapshot()
+
+    @contextlib.contextmanager
+    def profile(self, reset=True):
+
+        # instrument within the block, restoring the previous setting after
+        enabled = self._stats.enabled
+        if reset:
+            self._stats.reset()
+        self.instrument(True)
+        try:
+            yield self._stats
+        finally:
+            self.instrument(enabled)
+
+    def save_records(self, path):
+
+        # save records as a one trajectory dataset
+        Records.from_lists([self.states], [self.times], [self.controls]).save(path)
+
+    @staticmethod
+    def load_records(path, mmap_mode='r'):
+
+        # columnar trajectories, memory-mapped unless an archive
+        return Records.load(path, mmap_mode)
+
+    @property
+    def states(self):
+        return self._states.view()
+
+    @states.setter
+    def states(self, states):
+        self._states.clear()
+        self._states.extend(states)
+
+    @property
+    def times(self):
+        return self._times.view()
+
+    @times.setter
+    def times(self, times):
+        self._times.clear()
+        self._times.extend(times)
+
+    @property
+    def controls(self):
+        return self._controls.view()
+
+    @controls.setter
+    def controls(self, controls):
+        self._controls.clear()
+        self._controls.extend(controls)
 
     def _eom(self, t, state):
         return self._dynamics.eom_state(state, self._control)
@@ -85,6 +216,115 @@ class Mission(object):
     def _jac(self, t, state):
         return self._dynamics.eom_state_jac(state, self._control)
 
+    def _kernel(self):
+
+        # compiled Runge-Kutta steps, for the first order car only, looked up
+        # on each call so that instrumentation counts them
+        if type(self._dynamics) is not Dynamics:
+            return None
+        return lambda t, y, times: self._rk4(t, y, times)
+
+    def _rk4(self, t, y, times):
+
+        # states of shape (3, n) and one steering angle per state
+        y = np.asarray(y, float)
+        Y = y.reshape(3, -1)
+        u = np.broadcast_to(np.ravel(self._control), Y.shape[1]).astype(float)
+        return backend.rk4(Y, u, self._dynamics.v, self._dynamics.l, float(t), times).reshape(y.shape + (len(times),))
+
+    def _transitions(self, s0, s1, h, control):
+
+        # n transitions between states of shape (n, sdim) over durations h
+        s0, s1 = np.atleast_2d(s0), np.atleast_2d(s1)
+
+        # as the arcs swept under constant control
+        if self.ccd:
+            f = self._dynamics.eom_state(s0.T, control)
+            v = np.hypot(f[0], f[1])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                k = np.nan_to_num(f[2]/v)
+            arcs = np.column_stack((s0[:, :3], k*np.ones(len(s0)), v*h))
+            return self._environment.safe_arcs(arcs)
+
+        # or as straight chords
+        else:
+            return self._environment.safe_segments(np.stack((s0[:, :2], s1[:, :2]), axis=1))
+
+    def _segment(self, control, tf, verbose=False):
+
+        # integrate to tf under constant control
+        self._control = control
+        s0, t0 = self._integrator.y, self._integrator.t
+        states, times = self._integrator.segment(tf)
+
+        # check safety of new positions and transitions
+        pts = states[:, :2]
+        prev = np.vstack((s0, states[:-1]))
+        h = np.diff(np.hstack((t0, times)))
+        safe = self._environment.safe_points(pts) & self._transitions(prev, states, h, control)
+
+        # check if near target
+        done = np.linalg.norm(pts - self.target, axis=1) < 0.1
+
+        # truncate at the first unsafe or done state
+        stop = ~safe | done
+        k = np.argmax(stop) if stop.any() else len(times) - 1
+        states, times = states[:k + 1], times[:k + 1]
+        controls = np.full(k + 1, control, float)
+
+        # print if desired
+        if verbose:
+            for i in range(k + 1):
+                print('State: {0:<30} Time: {1:<10.3f} Control: {2:<10.3f} Safe: {3:<10} Done: {4:<10}'.format(str(states[i]), times[i], control, str(safe[i]), str(done[i])))
+
+        return states, controls, times, bool(safe[k]), bool(done[k])
+
+    def _root(self, fun, a, b, tol=1e-9):
+
+        # first time fun turns non-positive, given fun(a) > 0 >= fun(b), by bisection
+        while b - a > tol*max(1, abs(b)):
+            m = (a + b)/2
+            if fun(m) > 0:
+                a = m
+            else:
+                b = m
+
+        return b
+
+    def _event(self, sp, tp, s1, t1, free):
+
+        # nothing to check before reaching the free time of the last check
+        if t1 < free:
+            return True, False, s1, t1, free
+
+        # clearance, and distance to the target zone
+        c = self._environment.distance(s1[:2])[0]
+        g = np.linalg.norm(s1[:2] - self.target) - 0.1
+
+        # the step stays within its travel of the new position
+        reach = self._speed*(t1 - tp)
+        safe = bool(c > reach) or (self.safe(s1[:2]) and bool(self._transitions(sp, s1, t1 - tp, self._control)[0]))
+        done = bool(g < 0)
+
+        # locate the first event within the step on the dense output
+        if not safe or done:
+            sol = self._integrator.dense_output()
+            tc = self._root(lambda t: self._environment.distance(sol(t)[:2])[0], tp, t1) if c <= 0 else t1
+            tg = self._root(lambda t: np.linalg.norm(sol(t)[:2] - self.target) - 0.1, tp, t1) if done else np.inf
+
+            # reaching the target first
+            if tg <= tc:
+                t1, s1 = tg, sol(tg)
+                safe = self.safe(s1[:2]) and bool(self._transitions(sp, s1, t1 - tp, self._control)[0])
+
+            # or colliding first
+            elif tc < t1:
+                t1, s1 = tc, sol(tc)
+                done = self.done(s1[:2])
+
+        # time until anything can next be reached
+        return safe, done, s1, t1, t1 + min(c, g)/self._speed
+
     def safe(self, p0, p1=None):
 
         p0 = np.array(p0, float)
@@ -116,64 +356,90 @@ class Mission(object):
             # final time
             tf = t0 + Dt
 
-            # create records
-            states   = np.empty((0,3), float)
-            times    = np.empty((1,0), float)
-            controls = np.empty((1,0), float)
+            # preallocated records, for at least one state per maximum step
+            n = int(np.ceil(Dt/self._max_step)) + 1
+            states   = Buffer((self._dynamics.sdim,), n)
+            times    = Buffer((), n)
+            controls = Buffer((), n)
 
             # integrate until desired time is reached
             safe, done = True, False
 
-            # if integrating forward
-            while safe and not done:
-
-                # if control is a function
-                if callable(control):
-                    self._control = control(self._integrator.t, self._integrator.y)
-                else:
-                    self._control = control
-
-                # integration step
-                self._integrator.step()
-
-                # extract new state and time
-                s1, t1 = self._integrator.y, self._integrator.t
-
-                # adjust if over boundry
-                if self._integrator.direction == 1 and t1 >= tf:
-                    t1 = tf
-                    s1 = self._integrator.dense_output()(t1)
-                    final = True
-                else:
-                    final = False
-
-                # check safety of new position
-                if not self.safe(s1[:2]):
-                    safe = False
-                # check for intersection
-                elif not self.safe(s0[:2], s1[:2]):
-                    safe = False
-                # if we good
-                else:
-                    safe = True
-
-                # check if near target
-                done = self.done(s1[:2])
+            # integrate a constant control segment in one call
+            if not callable(control) and hasattr(self._integrator, 'segment'):
+                states, controls, times, safe, done = self._segment(control, tf, verbose)
+                s1, t1 = states[-1], times[-1]
 
-                # print if desired
-                if verbose:
-                    print('State: {0:<30} Time: {1:<10.3f} Control: {2:<10.3f} Safe: {3:<10} Done: {4:<10}'.format(str(s1), t1, self._control, str(safe), str(done)))
 
-                # records
-                states   = np.vstack((states, s1))
-                times    = np.append(times, t1)
-                controls = np.append(controls, self._control)
+            # otherwise integrate step by step
+            else:
 
-                # break if final
-                if final:
-                    break
-                else:
-                    continue
+                # previous state and time, and time until a check is needed
+                sp, tp = s0, t0
+                free = -np.inf
+
+                while safe and not done:
+
+                    # if control is a function
+                    if callable(control):
+                        self._control = control(self._integrator.t, self._integrator.y)
+                    else:
+                        self._control = control
+
+                    # with the solver's derivative under a new control
+                    if callable(control) or tp == t0:
+                        self._restart()
+
+                    # integration step
+                    self._integrator.step()
+
+                    # extract new state and time
+                    s1, t1 = self._integrator.y, self._integrator.t
+
+                    # adjust if over boundry
+                    if self._integrator.direction == 1 and t1 >= tf:
+                        t1 = tf
+                        s1 = self._integrator.dense_output()(t1)
+                        final = True
+                    else:
+                        final = False
+
+                    # check only when something may be reached, stopping at the event
+                    if self.events:
+                        safe, done, s1, t1, free = self._event(sp, tp, s1, t1, free)
+                        final = final or not safe or done
+
+                    # check safety of new position
+                    elif not self.safe(s1[:2]):
+                        safe = False
+                    # check for intersection
+                    elif not self._transitions(sp, s1, t1 - tp, self._control)[0]:
+                        safe = False
+                    # if we good
+                    else:
+                        safe = True
+
+                    # check if near target
+                    if not self.events:
+                        done = self.done(s1[:2])
+
+                    # print if desired
+                    if verbose:
+                        print('State: {0:<30} Time: {1:<10.3f} Control: {2:<10.3f} Safe: {3:<10} Done: {4:<10}'.format(str(s1), t1, self._control, str(safe), str(done)))
+
+                    # records
+                    states.append(s1)
+                    times.append(t1)
+                    controls.append(self._control)
+                    sp, tp = s1, t1
+
+                    # break if final
+                    if final:
+                        break
+                    else:
+                        continue
+
+                states, controls, times = states.view(), controls.view(), times.view()
 
             s, u, t = states, controls, times
 
@@ -186,7 +452,8 @@ class Mission(object):
             else:
                 self._control = control
 
-            # take one integration step
+            # take one integration step, with the solver's derivative under this control
+            self._restart()
             self._integrator.step()
 
             # extract new state and time
@@ -196,7 +463,7 @@ class Mission(object):
             if not self.safe(s1[:2]):
                 safe = False
             # check for intersection
-            elif not self.safe(s0[:2], s1[:2]):
+            elif not self._transitions(s0, s1, t1 - t0, self._control)[0]:
                 safe = False
             # if we good
             else:
@@ -220,18 +487,74 @@ class Mission(object):
 
         return s, u, t, safe, done
 
-    def simulate(self, controls, times, verbose=False):
+    def _simulate(self, controls, times):
+
+        # k constant controls over k + 1 times
+        controls = np.asarray(controls, float).reshape(-1)
+        times = np.asarray(times, float)
+        k = len(controls)
+        s0 = self.state
+        if k == 0:
+            return s0[None], True, False
+
+        # segment durations, and turning rates and curvatures under each control
+        T = np.diff(times[:k + 1])
+        w = self._dynamics.eom_state(np.tile(s0[:, None], k), controls)[2]
+        v = self._dynamics.v
+        kappa = w/v
+
+        # segment start poses, by chaining arcs
+        theta = s0[2] + np.hstack((0, np.cumsum(w*T)))
+        c = v*T*np.sinc(w*T/(2*np.pi))
+        mid = theta[:-1] + w*T/2
+        x = s0[0] + np.hstack((0, np.cumsum(c*np.cos(mid))))
+        y = s0[1] + np.hstack((0, np.cumsum(c*np.sin(mid))))
+        q = np.column_stack((x, y, theta))[:k]
+
+        # sample times at the maximum step within each segment, ending on its final time
+        n = np.maximum(np.ceil(T/self._max_step - 1e-9).astype(int), 1)
+        j = np.repeat(np.arange(k), n)
+        i = util.ranges(np.ones(k, int), n)
+        t = np.where(i == n[j], times[j + 1], times[j] + self._max_step*i)
+
+        # states along every segment at once
+        states = paths.arc(q[j], kappa[j], v*(t - times[j]))
+
+        # check safety of new positions and transitions
+        prev = np.vstack((s0, states[:-1]))
+        h = np.diff(np.hstack((times[0], t)))
+        safe = self._environment.safe_points(states[:, :2]) & self._transitions(prev, states, h, controls[j])
+
+        # check if near target
+        done = np.linalg.norm(states[:, :2] - self.target, axis=1) < 0.1
+
+        # truncate at the first unsafe or done state
+        stop = ~safe | done
+        m = np.argmax(stop) if stop.any() else len(t) - 1
+        self.record(states[:m + 1], controls[j[:m + 1]], t[:m + 1])
+        self.set(states[m], t[m])
+
+        return states[:m + 1], bool(safe[m]), bool(done[m])
+
+    def simulate(self, controls, times, verbose=False, fast=True):
 
         # reset state and time record
         self.reset()
 
-        for i in range(len(controls)):
+        # piecewise-constant controls in closed form, for the first order car under
+        # the exact arc integrator, which it reproduces, leaving the others as references
+        if fast and self.integrator == 'arc' and type(self._dynamics) is Dynamics and not verbose and not self.events:
+            s, safe, done = self._simulate(controls, times)
 
-            # integrate
-            s, u, t, safe, done = self.step(controls[i], Dt=times[i+1]-self.time, inplace=True, verbose=verbose, record=True)
+        # otherwise step through each control
+        else:
+            for i in range(len(controls)):
 
-            if not safe or done:
-                break
+                # integrate
+                s, u, t, safe, done = self.step(controls[i], Dt=times[i+1]-self.time, inplace=True, verbose=verbose, record=True)
+
+                if not safe or done:
+                    break
 
         # if succesful
         if safe and done:
@@ -249,9 +572,164 @@ class Mission(object):
             # return percent distance acheived
             return 1 - d/D
 
+    def simulate_batch(self, controls, times, states=None):
+
+        # n control sequences of length k, shared times of length k + 1
+        controls = np.atleast_2d(np.array(controls, float))
+        times = np.array(times, float)
+        n, k = controls.shape
+
+        # start states of shape (sdim, n), by default the origin
+        if states is None:
+            s = np.repeat(np.hstack((self.origin, np.zeros(self._dynamics.sdim - 2)))[:, None], n, axis=1)
+        else:
+            s = np.array(states, float).reshape(n, self._dynamics.sdim).T
+
+        # fixed-step integrator, also standing in for rk45
+        if isinstance(self._integrator, RK4):
+            integrator = self._integrator
+        else:
+            integrator = RK4(self._eom, 0, s[:, 0], max_step=self._max_step, kernel=self._kernel())
+
+        # per rollout safety, target, and activity masks
+        safe = np.ones(n, bool)
+        done = np.zeros(n, bool)
+        alive = np.ones(n, bool)
+
+        for j in range(k):
+
+            # active rollouts
+            i = np.flatnonzero(alive)
+            if len(i) == 0:
+                break
+
+            # integrate active rollouts over this control segment
+            self._control = controls[i, j][:, None]
+            grid = integrator.grid(times[j], times[j + 1])
+            S = integrator.propagate(times[j], s[:, i], grid)
+
+            # states before and after each transition, of shape (n, m, sdim)
+            S1 = S.transpose(1, 2, 0)
+            S0 = np.concatenate((s[:, i].T[:, None], S1[:, :-1]), axis=1)
+            p1 = S1[..., :2]
+
+            # step durations and controls of each transition
+            h = np.tile(np.diff(np.hstack((times[j], grid))), len(i))
+            u = np.repeat(controls[i, j], len(grid))
+
+            # check safety of new positions and transitions
+            ok = self._environment.safe_points(p1.reshape(-1, 2))
+            ok &= self._transitions(S0.reshape(-1, S.shape[0]), S1.reshape(-1, S.shape[0]), h, u)
+            ok = ok.reshape(len(i), len(grid))
+
+            # check if near target
+            near = np.linalg.norm(p1 - self.target, axis=2) < 0.1
+
+            # stop each rollout at its first unsafe or done state
+            stop = ~ok | near
+            last = np.where(stop.any(axis=1), stop.argmax(axis=1), len(grid) - 1)
+            r = np.arange(len(i))
+            s[:, i] = S[:, r, last]
+            safe[i], done[i] = ok[r, last], near[r, last]
+
+            # terminate unsafe or finished rollouts
+            alive[i] = safe[i] & ~done[i]
+
+        # origin distance from target
+        D = np.linalg.norm(self.target - self.origin)
+
+        # car distance to target
+        d = np.linalg.norm(self.target - s[:2].T, axis=1)
+
+        # percent distance acheived, or 1 if succesful
+        return np.where(safe & done, 1, 1 - d/D)
+
+    def sensitivity(self, controls, times, margin=1.0):
+
+        '''
+        Gradients of rollouts under n piecewise-constant control sequences
+        of shape (n, k), or one of shape (k,), over shared times of length
+        k + 1, from the origin. The clearance cost sums squared shortfalls
+        of the environment's clearance below margin, weighted by step
+        duration. Rollouts follow fixed Runge-Kutta steps of at most the
+        maximum step, without stopping at collisions or the target, and
+        are differentiated exactly through those steps, with one adjoint
+        per final state component and one for the cost, all propagated
+        backwards together. Returns final states of shape (n, sdim), their
+        Jacobians with respect to the controls of shape (n, sdim, k),
+        costs of shape (n,), and their gradients of shape (n, k).
+        '''
+
+        # n control sequences of length k, shared times of length k + 1
+        single = np.ndim(controls) == 1
+        controls = np.atleast_2d(np.array(controls, float))
+        times = np.array(times, float)
+        n, k = controls.shape
+        sdim = self._dynamics.sdim
+
+        # uniform steps within each segment, and the segment of each step
+        m = np.maximum(np.ceil(np.diff(times[:k + 1])/self._max_step - 1e-9).astype(int), 1)
+        seg = np.repeat(np.arange(k), m)
+        h = np.repeat(np.diff(times[:k + 1])/m, m)
+
+        # states of shape (steps + 1, sdim, n), from the origin
+        S = np.empty((len(seg) + 1, sdim, n))
+        S[0] = np.hstack((self.origin, np.zeros(sdim - 2)))[:, None]
+
+        # forward Runge-Kutta pass
+        f = self._dynamics.eom_state
+        for i, (j, hi) in enumerate(zip(seg, h)):
+            s, u = S[i], controls[:, j]
+            k1 = f(s, u)
+            k2 = f(s + hi/2*k1, u)
+            k3 = f(s + hi/2*k2, u)
+            k4 = f(s + hi*k3, u)
+            S[i + 1] = s + hi/6*(k1 + 2*k2 + 2*k3 + k4)
+
+        # clearance shortfall after every step, and its gradient with respect to position
+        pts = S[1:, :2].transpose(0, 2, 1).reshape(-1, 2)
+        c, g = self._environment.clearance(pts, grad=True)
+        short = np.maximum(margin - c, 0).reshape(-1, n)
+        g = g.reshape(-1, n, 2)
+        cost = (h[:, None]*short**2).sum(axis=0)
+
+        # adjoints of shape (sdim, sdim + 1, n): the final state's components, then the cost
+        lam = np.zeros((sdim, sdim + 1, n))
+        lam[:, :sdim] = np.eye(sdim)[..., None]
+        grad = np.zeros((sdim + 1, n, k))
+
+        # backward pass, through each step's stages in reverse
+        A, B = self._dynamics.eom_state_jac, self._dynamics.eom_control_jac
+        for i in range(len(seg) - 1, -1, -1):
+
+            # cost incurred after this step
+            lam[:2, sdim] -= 2*h[i]*(short[i][:, None]*g[i]).T
+
+            # stage states
+            j, hi = seg[i], h[i]
+            s, u = S[i], controls[:, j]
+            k1 = f(s, u)
+            k2 = f(s + hi/2*k1, u)
+            k3 = f(s + hi/2*k2, u)
+            y = (s, s + hi/2*k1, s + hi/2*k2, s + hi*k3)
+
+            # stage adjoints, weighted as in the update, and fed back through earlier stages
+            w = [hi/6*lam, hi/3*lam, hi/3*lam, hi/6*lam]
+            for a, b in ((3, hi), (2, hi/2), (1, hi/2), (0, 0)):
+                mu = np.einsum('jin,jrn->irn', A(y[a], u), w[a])
+                grad[:, :, j] += np.einsum('jn,jrn->rn', B(y[a], u)[:, 0], w[a])
+                if a > 0:
+                    w[a - 1] = w[a - 1] + b*mu
+                lam = lam + mu
+
+        # final states, their Jacobians, costs, and cost gradients
+        out = S[-1].T, grad[:sdim].transpose(1, 0, 2), cost, grad[sdim]
+        return tuple(o[0] for o in out) if single else out
+
     def plot_traj(self, ax=None):
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots(1)
 
         # plot trajectory
@@ -273,6 +751,7 @@ class Mission(object):
     def plot_records(self, ax=None):
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots(self._dynamics.sdim + 1, sharex=True)
 
         # plot states
@@ -1,12 +1,12 @@
 # Christopher Iliffe Sprague
 # sprague@kth.se
 
-import numpy as np, matplotlib.pyplot as plt
-from . import util
+import numpy as np
+from . import util, backend
 
 class Obstacle(object):
 
-    def __init__(self, x, y, dlb, dub, nvert):
+    def __init__(self, x, y, dlb, dub, nvert, rng=None):
 
         # cartesian position
         self.p = np.array([x, y], float)
@@ -18,29 +18,43 @@ class Obstacle(object):
         self.n = nvert
 
         # generate verticies
-        self.gen_verts()
+        self.gen_verts(rng)
 
-    def gen_verts(self):
+    @classmethod
+    def from_verts(cls, x, y, dlb, dub, verts):
+
+        # obstacle with given vertices
+        ob = cls.__new__(cls)
+        ob.p = np.array([x, y], float)
+        ob.rlb, ob.rub = dlb/2, dub/2
+        ob.verts = np.asarray(verts, float)
+        ob.n = len(ob.verts)
+        return ob
+
+    def gen_verts(self, rng=None):
+
+        # random number generator, numpy's global one by default
+        if rng is None:
+            rng = np.random
 
         # angles
-        thetas = np.linspace(0, 2*np.pi, self.n) + np.random.uniform(0, 2*np.pi)
-
-        # vertices
-        self.verts = np.vstack(([
-            # random radius
-            np.random.uniform(self.rlb, self.rub)*
-            # x and y from theta
-            np.array([np.cos(theta), np.sin(theta)]) +
-            # position wrt origin
-            self.p
-            for theta in thetas
-        ]))
+        thetas = np.linspace(0, 2*np.pi, self.n) + rng.uniform(0, 2*np.pi)
+
+        # random radii
+        r = rng.uniform(self.rlb, self.rub, self.n)
+
+        # vertices, wrt origin
+        self.verts = r[:, None]*np.column_stack((np.cos(thetas), np.sin(thetas))) + self.p
 
     def point_inside(self, p):
 
         # extract point
         x, y = p
 
+        # compiled loop if selected
+        if backend.active():
+            return bool(backend.point_inside(self.verts, float(x), float(y)))
+
         # first vertex
         x0, y0 = self.verts[0, 0], self.verts[0, 1]
 
@@ -60,6 +74,10 @@ class Obstacle(object):
 
     def line_intersect(self, seg0):
 
+        # compiled loop if selected
+        if backend.active():
+            return bool(backend.line_intersect(self.verts, np.asarray(seg0, float)))
+
         # for each edge
         for i in range(self.n - 1):
 
@@ -75,6 +93,7 @@ class Obstacle(object):
     def plot(self, ax=None, label=False):
 
         if ax is None:
+            import matplotlib.pyplot as plt
             fig, ax = plt.subplots(1)
 
         if label:
@@ -87,10 +106,163 @@ class Obstacle(object):
         except:
             pass
 
+class ObstacleSet(object):
+
+    '''
+    Struct-of-arrays store of many polygonal obstacles: every vertex in
+    one contiguous array delimited by offsets, with centres, radius
+    bounds, bounding boxes, and edge arrays alongside, so that point and
+    edge tests run over the whole set, or over candidate (query,
+    obstacle) pairs, at once. Indexing gives Obstacle views sharing the
+    vertex array.
+    '''
+
+    def __init__(self, verts, offsets, centres, bounds):
+
+        # vertices of obstacle i are verts[offsets[i]:offsets[i + 1]]
+        self.verts = np.asarray(verts, float).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, int)
+
+        # centres and diameter bounds, of shape (n, 2)
+        self.centres = np.asarray(centres, float).reshape(-1, 2)
+        self.bounds = np.asarray(bounds, float).reshape(-1, 2)
+        self.rlb, self.rub = self.bounds[:, 0]/2, self.bounds[:, 1]/2
+
+        # number and offsets of each obstacle's closed polygon edges
+        self.pn = np.diff(self.offsets)
+        self.poffs = self.offsets[:-1]
+
+        # and of its open edges, as walked by Obstacle.line_intersect
+        self.ln = np.maximum(self.pn - 1, 0)
+        self.loffs = np.cumsum(self.ln) - self.ln
+
+        # obstacle of each vertex, and the vertex following it around its polygon
+        owner = np.repeat(np.arange(len(self)), self.pn)
+        k = np.arange(len(self.verts))
+        nxt = np.where(k + 1 == self.offsets[1:][owner], self.poffs[owner], k + 1)
+
+        # closed polygon edges, for point queries
+        self.pedges = np.stack((self.verts, self.verts[nxt]), axis=1)
+
+        # open edges, dropping each polygon's closing edge, for segment queries
+        last = self.offsets[1:][owner] - 1
+        self.ledges = self.pedges[k != last]
+
+        # axis aligned bounding boxes, of shape (n, 2, 2) as (lower, upper)
+        if len(self) > 0:
+            self.aabbs = np.stack((
+                np.minimum.reduceat(self.verts, self.poffs),
+                np.maximum.reduceat(self.verts, self.poffs)
+            ), axis=1)
+        else:
+            self.aabbs = np.empty((0, 2, 2), float)
+
+    @classmethod
+    def random(cls, centres, dlb, dub, nvert, rng=None):
+
+        # random number generator, numpy's global one by default
+        if rng is None:
+            rng = np.random
+        centres = np.asarray(centres, float).reshape(-1, 2)
+        n = len(centres)
+
+        # angles and radii of every vertex, as in Obstacle.gen_verts
+        thetas = np.linspace(0, 2*np.pi, nvert) + rng.uniform(0, 2*np.pi, (n, 1))
+        r = rng.uniform(dlb/2, dub/2, (n, nvert))
+
+        # vertices, wrt origin
+        verts = r[..., None]*np.stack((np.cos(thetas), np.sin(thetas)), axis=2) + centres[:, None]
+
+        return cls(verts, nvert*np.arange(n + 1), centres, np.tile([dlb, dub], (n, 1)))
+
+    @classmethod
+    def from_obstacles(cls, obs):
+
+        # stack each obstacle's arrays
+        n = np.array([len(ob.verts) for ob in obs], int)
+        return cls(
+            np.vstack([ob.verts for ob in obs]) if len(obs) > 0 else np.empty((0, 2)),
+            np.hstack((0, np.cumsum(n))),
+            [ob.p for ob in obs],
+            [[2*ob.rlb, 2*ob.rub] for ob in obs]
+        )
+
+    def __len__(self):
+        return len(self.centres)
+
+    def __getitem__(self, i):
+
+        # obstacle viewing its slice of the vertex array
+        (x, y), (dlb, dub) = self.centres[i], self.bounds[i]
+        return Obstacle.from_verts(x, y, dlb, dub, self.verts[self.offsets[i]:self.offsets[i + 1]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def _pairs(self, m, q, o):
+
+        # every (query, obstacle) pair by default
+        if q is None:
+            q, o = np.repeat(np.arange(m), len(self)), np.tile(np.arange(len(self)), m)
+        return np.asarray(q, int), np.asarray(o, int)
+
+    def contains(self, pts, q=None, o=None):
+
+        # points of shape (m, 2) inside obstacles of (point, obstacle) pairs
+        pts = np.asarray(pts, float).reshape(-1, 2)
+        q, o = self._pairs(len(pts), q, o)
+        if len(q) == 0:
+            return np.zeros(0, bool)
+
+        # crossing parity over each pair's polygon edges
+        e = util.ranges(self.poffs[o], self.pn[o])
+        cross = util.crossings(np.repeat(pts[q], self.pn[o], axis=0), self.pedges[e])
+        return np.logical_xor.reduceat(cross, np.cumsum(self.pn[o]) - self.pn[o])
+
+    def _hits(self, hit, o):
+
+        # any edge hit per pair
+        n = self.ln[o]
+        return np.bincount(np.repeat(np.arange(len(o)), n), hit, len(o)) > 0
+
+    def intersects(self, segs, q=None, o=None):
+
+        # segments of shape (m, 2, 2) crossing obstacles of (segment, obstacle) pairs
+        segs = np.asarray(segs, float).reshape(-1, 2, 2)
+        q, o = self._pairs(len(segs), q, o)
+
+        # test against each pair's open edges
+        e = util.ranges(self.loffs[o], self.ln[o])
+        return self._hits(util.intersections(np.repeat(segs[q], self.ln[o], axis=0), self.ledges[e]), o)
+
+    def arc_intersects(self, arcs, q=None, o=None):
+
+        # arcs of shape (m, 5) crossing obstacles of (arc, obstacle) pairs
+        arcs = np.asarray(arcs, float).reshape(-1, 5)
+        q, o = self._pairs(len(arcs), q, o)
+
+        # test against each pair's open edges
+        e = util.ranges(self.loffs[o], self.ln[o])
+        return self._hits(util.arc_intersections(np.repeat(arcs[q], self.ln[o], axis=0), self.ledges[e]), o)
+
+    def distances(self, pts, q=None, o=None):
+
+        # distance from points of shape (m, 2) to the boundaries of (point, obstacle) pairs
+        pts = np.asarray(pts, float).reshape(-1, 2)
+        q, o = self._pairs(len(pts), q, o)
+        if len(q) == 0:
+            return np.zeros(0, float)
+
+        # closest polygon edge per pair
+        e = util.ranges(self.poffs[o], self.pn[o])
+        d = util.distances(np.repeat(pts[q], self.pn[o], axis=0), self.pedges[e])
+        return np.minimum.reduceat(d, np.cumsum(self.pn[o]) - self.pn[o])
+
 
 if __name__ == '__main__':
 
     # instantiate obstacle
+    import matplotlib.pyplot as plt
     obs = Obstacle(0, 0, 10, 20, 20)
 
     # plot obstacle
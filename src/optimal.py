@@ -0,0 +1,240 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+from . import backend
+from .dynamics import Dynamics_2nd
+
+class Shooting(object):
+
+    '''
+    Indirect shooting for Dynamics_2nd, following Pontryagin's maximum
+    principle: the state and costate are integrated together under the
+    control minimising the Hamiltonian, and the initial costate is found
+    by Newton's method so that the car reaches the mission's target at
+    time tf with free final heading, steering angle, and steering rate.
+    Newton updates use the state transition matrix, integrated alongside
+    with the analytic fullstate Jacobian, and many initial guesses are
+    solved at once as one batch.
+    '''
+
+    def __init__(self, mission, tf=None, steps=200):
+
+        # mission and its second order dynamics
+        if not isinstance(mission._dynamics, Dynamics_2nd):
+            raise ValueError('Shooting needs Dynamics_2nd.')
+        self.mission = mission
+        self._dynamics = mission._dynamics
+
+        # initial state at the origin, at rest
+        self.s0 = np.hstack((mission.origin, np.zeros(3)))
+
+        # final time, by default slightly longer than the straight line,
+        # as longer times need looping paths that are hard to converge to
+        if tf is None:
+            tf = 1.05*np.linalg.norm(mission.target - mission.origin)
+        self.tf = float(tf)
+
+        # fixed Runge-Kutta steps
+        self.steps = int(steps)
+
+        # solution
+        self.costate = None
+
+    def control(self, z):
+
+        # Hamiltonian minimising control, within its bounds
+        return np.clip(self._dynamics.pontryagin(z), -1, 1)
+
+    def _rates(self, z, P):
+
+        # optimal control and whether it is unsaturated
+        u = self._dynamics.pontryagin(z)
+        free = np.abs(u) < 1
+        u = np.clip(u, -1, 1)
+
+        # common subexpressions of the fullstate rate and its Jacobian
+        x, y, theta, phi, omega, lx, ly, ltheta, lphi, lomega = z
+        s, c, t = np.sin(theta), np.cos(theta), np.tan(phi)
+        x2 = 1/(self._dynamics.l*np.cos(phi)**2)
+
+        # fullstate rate, as Dynamics_2nd.eom_fullstate
+        f = np.empty_like(z)
+        f[0], f[1], f[2], f[3], f[4] = c, s, t/self._dynamics.l, omega, u
+        f[5:7] = 0
+        f[7], f[8], f[9] = lx*s - ly*c, -ltheta*x2, -lphi
+
+        # transition matrix rate from the nonzero rows of Dynamics_2nd.eom_fullstate_jac,
+        # with the control's dependence on the costate, and constant lx and ly
+        g = np.empty_like(P)
+        g[0], g[1] = -s*P[2], c*P[2]
+        g[2], g[3] = x2*P[3], P[4]
+        g[4] = np.where(free, 1/(2*(self._dynamics.alpha - 1)), 0)*P[9]
+        g[5:7] = 0
+        g[7] = (lx*c + ly*s)*P[2] + s*P[5] - c*P[6]
+        g[8] = -2*ltheta*x2*t*P[3] - x2*P[7]
+        g[9] = -P[8]
+
+        # running cost
+        L = self._dynamics.lagrangian(u)
+        return f, g, L
+
+    def propagate(self, costates, m=None):
+
+        '''
+        Integrate fullstates of shape (10, n) from the origin under each of
+        n initial costates of shape (n, 5). Returns fullstates of shape
+        (10, n, m) at m evenly spaced times, the final transition matrix
+        with respect to the initial costate of shape (10, 5, n), and the
+        cost of each trajectory.
+        '''
+
+        costates = np.atleast_2d(costates)
+        n = len(costates)
+        h = self.tf/self.steps
+
+        # fullstates, transition matrices, and costs
+        z = np.vstack((np.repeat(self.s0[:, None], n, axis=1), costates.T))
+        P = np.zeros((10, 5, n))
+        P[5:] = np.eye(5)[..., None]
+        J = np.zeros(n)
+
+        # recorded fullstates
+        keep = np.round(np.linspace(0, self.steps, m)).astype(int) if m is not None else np.array([self.steps])
+
+        # compiled, guess by guess
+        if backend.active():
+            return backend.shoot(z, P, h, self.steps, keep, self._dynamics.l, self._dynamics.alpha)
+
+        Z = np.empty((10, n, len(keep)))
+        if keep[0] == 0:
+            Z[..., 0] = z
+
+        for i in range(1, self.steps + 1):
+
+            # one Runge-Kutta step of the fullstate, transition matrix, and cost
+            f1, g1, L1 = self._rates(z, P)
+            f2, g2, L2 = self._rates(z + h/2*f1, P + h/2*g1)
+            f3, g3, L3 = self._rates(z + h/2*f2, P + h/2*g2)
+            f4, g4, L4 = self._rates(z + h*f3, P + h*g3)
+            z = z + h/6*(f1 + 2*f2 + 2*f3 + f4)
+            P = P + h/6*(g1 + 2*g2 + 2*g3 + g4)
+            J = J + h/6*(L1 + 2*L2 + 2*L3 + L4)
+
+            # record
+            Z[..., keep == i] = z[..., None]
+
+        return Z, P, J
+
+    def residuals(self, costates):
+
+        # final position error and transversality conditions, and their Jacobian
+        Z, P, J = self.propagate(costates)
+        z = Z[..., -1]
+        rows = [0, 1, 7, 8, 9]
+        r = z[rows] - np.vstack((self.mission.target[:, None], np.zeros((3, 1))))
+
+        return r.T, P[rows].transpose(2, 0, 1), J
+
+    def _scales(self):
+
+        # sensitivity of the residuals to each costate about zero, spanning many orders of magnitude
+        r, D, J = self.residuals(np.zeros((1, 5)))
+        col = np.linalg.norm(D[0], axis=0)
+
+        # costate sizes giving residual changes comparable to the initial error,
+        # the smallest of them for costates without first order effect
+        scale = np.linalg.norm(r)/np.where(col > 0, col, np.inf)
+        scale[col == 0] = scale[col > 0].min()
+        col[col == 0] = 1/scale[col == 0]
+        return col, scale
+
+    def guesses(self, n, seed=None, scale=None):
+
+        # random initial costates of the size of the initial error, and a few orders of magnitude smaller
+        rng = np.random.default_rng(seed)
+        if scale is None:
+            col, scale = self._scales()
+        return rng.normal(size=(n, 5))*scale*10**rng.uniform(-2, 0, (n, 1))
+
+    def solve(self, n=16, iters=30, tol=1e-6, costates=None, seed=None, steps=8):
+
+        '''
+        Run damped Newton iterations from n random initial costates, or the
+        given ones, all at once, in coordinates scaled by each costate's
+        effect on the residuals. Each iteration tries every full Newton
+        step in one batch, then steps - 1 halvings of those that fail to
+        reduce the residual in another, and keeps the longest that does. Keeps the cheapest converged solution, and
+        returns its initial costate, or None if none converged.
+        '''
+
+        # costate scaling, and initial guesses
+        col, scale = self._scales()
+        lam = self.guesses(n, seed, scale) if costates is None else np.atleast_2d(np.array(costates, float))
+
+        # residuals, Jacobians, and costs of every guess
+        r, D, cost = self.residuals(lam)
+        err = np.linalg.norm(r, axis=1)
+
+        # step lengths to try
+        a = 0.5**np.arange(steps)
+
+        for it in range(iters):
+
+            # unconverged guesses
+            i = np.flatnonzero(np.isfinite(err) & (err > tol))
+            if len(i) == 0:
+                break
+
+            # Newton step in scaled coordinates
+            d = -np.einsum('nij,nj->ni', np.linalg.pinv(D[i]/col), r[i])/col
+
+            # full steps of every guess in one batch
+            trial = lam[i] + d
+            ri, Di, Ji = self.residuals(trial)
+            ei = np.linalg.norm(ri, axis=1)
+            ok = np.isfinite(ei) & (ei < err[i])
+
+            # then every shorter step length of the rest in another, of shape (steps - 1, guesses)
+            m = np.flatnonzero(~ok)
+            if len(m) > 0 and len(a) > 1:
+                t = (lam[i[m]] + a[1:, None, None]*d[m]).reshape(-1, 5)
+                rt, Dt, Jt = self.residuals(t)
+                et = np.linalg.norm(rt, axis=1).reshape(len(a) - 1, len(m))
+                better = np.isfinite(et) & (et < err[i[m]])
+
+                # longest improving one of each
+                k = np.argmax(better, axis=0)
+                found = better[k, np.arange(len(m))]
+                b = k[found]*len(m) + np.flatnonzero(found)
+                m = m[found]
+                trial[m], ri[m], Di[m], Ji[m], ei[m] = t[b], rt[b], Dt[b], Jt[b], et.ravel()[b]
+                ok[m] = True
+
+            # giving up on guesses without an improving step
+            err[i[~ok]] = np.inf
+            j = i[ok]
+            lam[j], r[j], D[j], cost[j], err[j] = trial[ok], ri[ok], Di[ok], Ji[ok], ei[ok]
+
+        # cheapest converged solution
+        ok = np.flatnonzero(err <= tol)
+        if len(ok) == 0:
+            return None
+        self.costate = lam[ok[np.argmin(cost[ok])]]
+        self.cost = cost[ok].min()
+        self.converged = len(ok)
+
+        return self.costate
+
+    def trajectory(self, m=None):
+
+        # fullstates and times of the solution
+        m = self.steps + 1 if m is None else m
+        Z, P, J = self.propagate(self.costate, m)
+        return Z[:, 0].T, np.linspace(0, self.tf, m)
+
+    def solution(self):
+
+        # piecewise-constant controls at the mean of each step's ends, for Mission.simulate
+        Z, t = self.trajectory()
+        return self.control(((Z[:-1] + Z[1:])/2).T), t
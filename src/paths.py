@@ -0,0 +1,163 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+
+# Dubins words and the curvature sign of each of their segments
+words = ['LSL', 'RSR', 'LSR', 'RSL', 'RLR', 'LRL']
+signs = np.array([
+    [ 1,  0,  1],
+    [-1,  0, -1],
+    [ 1,  0, -1],
+    [-1,  0,  1],
+    [-1,  1, -1],
+    [ 1, -1,  1]
+], float)
+
+def mod2pi(x):
+    return np.mod(x, 2*np.pi)
+
+# minimum turning radius of the car at full steering
+def radius(dyn):
+    return dyn.v*dyn.l/np.tan(dyn.umax)
+
+# segment lengths of all six words between (n, 3) poses, inf where infeasible
+def lengths(q0, q1, r):
+
+    # poses of shape (n, 3)
+    q0 = np.atleast_2d(np.asarray(q0, float))
+    q1 = np.atleast_2d(np.asarray(q1, float))
+
+    # normalised distance and headings relative to the line joining the poses
+    dx, dy = q1[:, 0] - q0[:, 0], q1[:, 1] - q0[:, 1]
+    d = np.hypot(dx, dy)/r
+    theta = mod2pi(np.arctan2(dy, dx))
+    a, b = mod2pi(q0[:, 2] - theta), mod2pi(q1[:, 2] - theta)
+
+    # common terms
+    sa, sb, ca, cb = np.sin(a), np.sin(b), np.cos(a), np.cos(b)
+    cab = np.cos(a - b)
+
+    # normalised segment lengths (n, 6, 3)
+    L = np.full((len(d), 6, 3), np.inf)
+
+    with np.errstate(invalid='ignore'):
+
+        # LSL
+        p2 = 2 + d**2 - 2*cab + 2*d*(sa - sb)
+        tmp = np.arctan2(cb - ca, d + sa - sb)
+        L[:, 0, 0], L[:, 0, 1], L[:, 0, 2] = mod2pi(tmp - a), np.sqrt(p2), mod2pi(b - tmp)
+        L[p2 < 0, 0] = np.inf
+
+        # RSR
+        p2 = 2 + d**2 - 2*cab + 2*d*(sb - sa)
+        tmp = np.arctan2(ca - cb, d - sa + sb)
+        L[:, 1, 0], L[:, 1, 1], L[:, 1, 2] = mod2pi(a - tmp), np.sqrt(p2), mod2pi(tmp - b)
+        L[p2 < 0, 1] = np.inf
+
+        # LSR
+        p2 = -2 + d**2 + 2*cab + 2*d*(sa + sb)
+        p = np.sqrt(p2)
+        tmp = np.arctan2(-ca - cb, d + sa + sb) - np.arctan2(-2, p)
+        L[:, 2, 0], L[:, 2, 1], L[:, 2, 2] = mod2pi(tmp - a), p, mod2pi(tmp - b)
+        L[p2 < 0, 2] = np.inf
+
+        # RSL
+        p2 = -2 + d**2 + 2*cab - 2*d*(sa + sb)
+        p = np.sqrt(p2)
+        tmp = np.arctan2(ca + cb, d - sa - sb) - np.arctan2(2, p)
+        L[:, 3, 0], L[:, 3, 1], L[:, 3, 2] = mod2pi(a - tmp), p, mod2pi(b - tmp)
+        L[p2 < 0, 3] = np.inf
+
+        # RLR
+        tmp = (6 - d**2 + 2*cab + 2*d*(sa - sb))/8
+        phi = np.arctan2(ca - cb, d - sa + sb)
+        p = mod2pi(2*np.pi - np.arccos(tmp))
+        t = mod2pi(a - phi + mod2pi(p/2))
+        L[:, 4, 0], L[:, 4, 1], L[:, 4, 2] = t, p, mod2pi(a - b - t + p)
+        L[np.abs(tmp) > 1, 4] = np.inf
+
+        # LRL
+        tmp = (6 - d**2 + 2*cab + 2*d*(sb - sa))/8
+        phi = np.arctan2(ca - cb, d + sa - sb)
+        p = mod2pi(2*np.pi - np.arccos(tmp))
+        t = mod2pi(-a - phi + p/2)
+        L[:, 5, 0], L[:, 5, 1], L[:, 5, 2] = t, p, mod2pi(b - a - t + p)
+        L[np.abs(tmp) > 1, 5] = np.inf
+
+    # segment lengths [m]
+    return L*r
+
+# shortest word, its segment lengths (n, 3), and total length between (n, 3) poses
+def shortest(q0, q1, r):
+
+    # all words
+    L = lengths(q0, q1, r)
+
+    # shortest one
+    i = np.argmin(L.sum(axis=2), axis=1)
+    L = L[np.arange(len(i)), i]
+
+    return i, L, L.sum(axis=1)
+
+# segment lengths (n, 3) of paths cut short at arc lengths s (n,)
+def truncate(L, s):
+    L = np.atleast_2d(L)
+    starts = np.cumsum(L, axis=1) - L
+    return np.clip(np.reshape(s, (-1, 1)) - starts, 0, L)
+
+# states at arc lengths s (n, m) along paths from (n, 3) poses
+def state(q0, word, L, r, s):
+
+    # poses and segment lengths of shape (n, 3), arc lengths (n, m)
+    q0 = np.atleast_2d(np.asarray(q0, float))
+    L = np.atleast_2d(L)
+    s = np.asarray(s, float).reshape(len(q0), -1)
+
+    # segment curvatures
+    k = signs[np.broadcast_to(word, len(q0))]/r
+
+    # start poses of each segment
+    q = np.empty((len(q0), 3, 3), float)
+    q[:, 0] = q0
+    for j in range(2):
+        q[:, j + 1] = arc(q[:, j], k[:, j], L[:, j])
+
+    # segment and distance along it for each arc length
+    ends = np.cumsum(L, axis=1)
+    j = np.minimum((s[:, :, None] > ends[:, None, :2]).sum(axis=2), 2)
+    n = np.arange(len(q0))[:, None]
+    ds = s - (ends[n, j] - L[n, j])
+
+    # states of shape (n, m, 3)
+    return arc(q[n, j], k[n, j], ds)
+
+# pose after an arc of curvature k and length s from (..., 3) poses
+def arc(q, k, s):
+
+    # heading at the middle of the arc and chord length
+    theta = q[..., 2] + k*s/2
+    c = s*np.sinc(k*s/(2*np.pi))
+
+    return np.stack((
+        q[..., 0] + c*np.cos(theta),
+        q[..., 1] + c*np.sin(theta),
+        q[..., 2] + k*s
+    ), axis=-1)
+
+# m evenly spaced states (n, m, 3) along paths from (n, 3) poses
+def sample(q0, word, L, r, m):
+    L = np.atleast_2d(L)
+    return state(q0, word, L, r, np.linspace(0, 1, m)*L.sum(axis=1)[:, None])
+
+# piecewise-constant controls (n, 3) and times (n, 4) of paths, for Mission.simulate
+def controls(word, L, dyn):
+
+    # full steering on turns, none on straights
+    u = signs[np.atleast_1d(word)]*dyn.umax
+
+    # segment boundary times
+    t = np.cumsum(np.atleast_2d(L)/dyn.v, axis=1)
+    t = np.hstack((np.zeros((len(t), 1)), t))
+
+    return u, t
@@ -0,0 +1,349 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import time, numpy as np
+from scipy.spatial import cKDTree
+from . import paths
+from .buffer import Buffer
+
+class Dubins(object):
+
+    '''
+    Collision checking of Dubins paths and connection to the goal, shared
+    by planners with a mission, its environment, turning radius r,
+    collision checking resolution ds, clearance margin, and distance tol
+    to stop short of the target. Paths keep margin from obstacles and
+    boundaries, so that integrators other than the exact arcs, drifting
+    from them, still clear everything, except within 0.1 + margin of the
+    origin, by the boundary, and of the target, where only the mission's
+    own checks apply.
+    '''
+
+    def free(self, q0, word, L):
+
+        # sample paths at the collision checking resolution
+        L = np.atleast_2d(L)
+        total = L.sum(axis=1)
+        m = max(int(np.ceil(total.max()/self.ds)), 1) + 1
+        pts = paths.state(q0, word, L, self.r, np.linspace(0, 1, m)*total[:, None])[..., :2]
+        return self.clear(pts, self.ds)
+
+    def clear(self, pts, ds):
+
+        # points of paths of shape (n, m, 2), no more than ds apart, clear by margin and half of ds,
+        # keeping the chords between them clear by margin, except by the origin and target
+        m = pts.shape[1]
+        ends = np.minimum(
+            np.linalg.norm(pts - self.mission.origin, axis=2),
+            np.linalg.norm(pts - self.mission.target, axis=2)
+        ) < 0.1 + self.margin
+        safe = self._environment.clear_paths(pts, self.margin + ds/2, ends)
+
+        # check points and chords of paths by the origin or target as the mission does
+        near = np.flatnonzero(safe & ends.any(axis=1))
+        if len(near) > 0:
+            p = pts[near]
+            ok = self._environment.safe_points(p.reshape(-1, 2), fast=True).reshape(len(p), m).all(axis=1)
+            segs = np.stack((p[:, :-1], p[:, 1:]), axis=2).reshape(-1, 2, 2)
+            ok &= self._environment.safe_segments(segs, fast=True).reshape(len(p), m - 1).all(axis=1)
+            safe[near] = ok
+
+        return safe
+
+    def goal_path(self, q, reach):
+
+        # only try the goal from poses within reach
+        if np.linalg.norm(q[:2] - self.mission.target) > reach:
+            return None
+
+        # paths to the target at several headings, stopping just short of it
+        theta = np.linspace(-np.pi, np.pi, 8, endpoint=False)
+        qf = np.column_stack((np.tile(self.mission.target, (len(theta), 1)), theta))
+        word, L, total = paths.shortest(np.tile(q, (len(theta), 1)), qf, self.r)
+        L = paths.truncate(L, np.maximum(total - self.tol, 0))
+
+        # shortest collision free one, as (word, segment lengths)
+        ok = np.flatnonzero(self.free(np.tile(q, (len(theta), 1)), word, L))
+        if len(ok) == 0:
+            return None
+        j = ok[np.argmin(L[ok].sum(axis=1))]
+
+        return word[j], L[j]
+
+    def check(self, controls, times):
+
+        # whether the mission's own simulation, under its integrator, reaches the target
+        return self.mission.simulate(controls, times) == 1
+
+class RRT(Dubins):
+
+    '''
+    Rapidly-exploring random tree over the Dubins car's (x, y, theta)
+    states, steering along Dubins paths. Nearest neighbours come from a
+    k-d tree over node positions, rebuilt whenever the tree doubles in
+    size, and candidate edges are collision checked in batches.
+    '''
+
+    def __init__(self, mission, step=5, bias=0.05, k=10, ds=0.05, margin=0.1, tol=0.01, seed=None):
+
+        # mission, its environment, and dynamics
+        self.mission = mission
+        self._environment = mission._environment
+        self._dynamics = mission._dynamics
+
+        # turning radius
+        self.r = paths.radius(self._dynamics)
+
+        # maximum edge length, goal sampling probability, and number of neighbours
+        self.step = float(step)
+        self.bias = float(bias)
+        self.k = int(k)
+
+        # collision checking resolution, clearance margin, and distance to stop short of the target
+        self.ds = float(ds)
+        self.margin = float(margin)
+        self.tol = float(tol)
+
+        # random number generator
+        self.rng = np.random.default_rng(seed)
+
+        # initialise tree
+        self.reset()
+
+    def reset(self):
+
+        # nodes and the edges from their parents
+        self.poses   = Buffer((3,))
+        self.parents = Buffer((), dtype=int)
+        self.costs   = Buffer()
+        self.words   = Buffer((), dtype=int)
+        self.lengths = Buffer((3,))
+
+        # root at the origin
+        self._add(np.hstack((self.mission.origin, 0)), -1, 0, 0, np.zeros(3))
+
+        # nearest neighbour index and size when built
+        self._kd, self._nkd = None, 0
+
+        # goal connections as (node, word, segment lengths)
+        self.goals = list()
+
+    def _add(self, pose, parent, cost, word, L):
+
+        # append node
+        self.poses.append(pose)
+        self.parents.append(parent)
+        self.costs.append(cost)
+        self.words.append(word)
+        self.lengths.append(L)
+
+        return len(self.poses) - 1
+
+    def _nearest(self, p, k):
+
+        # rebuild index once the tree has doubled
+        n = len(self.poses)
+        if n >= 2*self._nkd:
+            self._kd, self._nkd = cKDTree(self.poses.view()[:, :2]), n
+
+        # indexed nearest neighbours
+        k = min(k, n)
+        d, i = self._kd.query(p, k=min(k, self._nkd))
+        d, i = np.atleast_1d(d), np.atleast_1d(i)
+
+        # nodes added since, by brute force
+        j = np.arange(self._nkd, n)
+        dj = np.linalg.norm(self.poses.view()[j, :2] - p, axis=1)
+
+        # k closest overall
+        d, i = np.append(d, dj), np.append(i, j)
+        return i[np.argsort(d, kind='stable')[:k]]
+
+    def sample(self):
+
+        # goal biased random pose
+        if self.rng.random() < self.bias:
+            return np.hstack((self.mission.target, self.rng.uniform(-np.pi, np.pi)))
+        else:
+            return self.rng.uniform([0, 0, -np.pi], [self._environment.lx, self._environment.ly, np.pi])
+
+    def extend(self, q):
+
+        # nearest nodes by Dubins distance among Euclidean neighbours
+        i = self._nearest(q[:2], self.k)
+        word, L, total = paths.shortest(self.poses.view()[i], q, self.r)
+        j = np.argmin(total)
+        i, word, L = i[j], word[j], L[j]
+
+        # steer at most one step
+        L = paths.truncate(L, min(total[j], self.step))
+        if not self.free(self.poses.view()[i], word, L)[0]:
+            return None
+        q = paths.state(self.poses.view()[i], word, L, self.r, L.sum())[0, 0]
+
+        return self._add(q, i, self.costs.view()[i] + L.sum(), word, L[0])
+
+    def connect(self, i):
+
+        # shortest collision free path to the goal, from nearby nodes
+        path = self.goal_path(self.poses.view()[i], self.step)
+        if path is None:
+            return False
+        self.goals.append((i,) + path)
+
+        return True
+
+    def plan(self, iters=5000, budget=None):
+
+        # wall clock limit
+        t0 = time.time()
+
+        for it in range(iters):
+
+            # grow the tree towards a random pose
+            i = self.extend(self.sample())
+
+            # stop at the first connection to the goal passing the mission's simulation
+            if i is not None and self.connect(i):
+                sol = self.solution()
+                if sol is not None:
+                    return sol
+
+            # stop when out of time
+            if budget is not None and time.time() - t0 > budget:
+                break
+
+        return self.solution()
+
+    def solution(self):
+
+        # cheapest goal connection passing the mission's simulation, dropping those that fail
+        while len(self.goals) > 0:
+            costs = [self.costs.view()[i] + L.sum() for i, w, L in self.goals]
+            j = int(np.argmin(costs))
+            controls, times = self._controls(*self.goals[j])
+            if self.check(controls, times):
+                return controls, times
+            self.goals.pop(j)
+
+        # no connection to the goal
+        return None
+
+    def _controls(self, i, word, L):
+
+        # edges from the goal back to the root
+        words, lengths = [word], [L]
+        while self.parents.view()[i] >= 0:
+            words.append(self.words.view()[i])
+            lengths.append(self.lengths.view()[i])
+            i = self.parents.view()[i]
+
+        # piecewise-constant controls and times
+        u, t = paths.controls(np.array(words[::-1]), np.array(lengths[::-1]), self._dynamics)
+        u, dt = u.ravel(), np.diff(t, axis=1).ravel()
+
+        # drop empty segments
+        keep = dt > 0
+        return u[keep], np.hstack((0, np.cumsum(dt[keep])))
+
+    def plot(self, ax=None):
+
+        if ax is None:
+            import matplotlib.pyplot as plt
+            fig, ax = plt.subplots(1)
+
+        # sample and plot edges
+        i = np.flatnonzero(self.parents.view() >= 0)
+        if len(i) > 0:
+            q0 = self.poses.view()[self.parents.view()[i]]
+            pts = paths.sample(q0, self.words.view()[i], self.lengths.view()[i], self.r, 10)
+            for p in pts:
+                ax.plot(p[:, 0], p[:, 1], 'k-', alpha=0.3, lw=0.5)
+
+        try:
+            return fig, ax
+        except:
+            pass
+
+class RRTStar(RRT):
+
+    '''
+    Asymptotically optimal variant of RRT, choosing each new node's parent
+    among its k-nearest neighbours, with k growing logarithmically in the
+    size of the tree, and rewiring those neighbours through the new node.
+    '''
+
+    def extend(self, q):
+
+        # grow as in RRT
+        i = RRT.extend(self, q)
+        if i is None:
+            return None
+        q = self.poses.view()[i]
+
+        # neighbours of the new node
+        k = int(np.ceil(2*np.e*np.log(len(self.poses))))
+        near = self._nearest(q[:2], k + 1)
+        near = near[near != i]
+        if len(near) == 0:
+            return i
+
+        # cheapest collision free parent
+        word, L, total = paths.shortest(self.poses.view()[near], q, self.r)
+        costs = self.costs.view()[near] + total
+        better = costs < self.costs.view()[i]
+        if better.any():
+            better = np.flatnonzero(better)
+            better = better[self.free(self.poses.view()[near[better]], word[better], L[better])]
+            if len(better) > 0:
+                j = better[np.argmin(costs[better])]
+                self.parents.data[i] = near[j]
+                self.costs.data[i] = costs[j]
+                self.words.data[i] = word[j]
+                self.lengths.data[i] = L[j]
+
+        # rewire neighbours through the new node
+        word, L, total = paths.shortest(np.tile(q, (len(near), 1)), self.poses.view()[near], self.r)
+        costs = self.costs.view()[i] + total
+        better = np.flatnonzero(costs < self.costs.view()[near])
+        if len(better) > 0:
+            better = better[self.free(np.tile(q, (len(better), 1)), word[better], L[better])]
+            for j in better:
+                self._rewire(near[j], i, costs[j], word[j], L[j])
+
+        return i
+
+    def _rewire(self, j, i, cost, word, L):
+
+        # new parent and edge
+        delta = cost - self.costs.data[j]
+        self.parents.data[j] = i
+        self.words.data[j] = word
+        self.lengths.data[j] = L
+
+        # update cost of the node and its descendants
+        nodes = np.array([j])
+        parents = self.parents.view()
+        while len(nodes) > 0:
+            self.costs.data[nodes] += delta
+            nodes = np.flatnonzero(np.isin(parents, nodes))
+
+    def plan(self, iters=300, budget=None):
+
+        # wall clock limit
+        t0 = time.time()
+
+        for it in range(iters):
+
+            # grow and rewire the tree towards a random pose
+            i = self.extend(self.sample())
+
+            # keep every connection to the goal
+            if i is not None:
+                self.connect(i)
+
+            # stop when out of time
+            if budget is not None and time.time() - t0 > budget:
+                break
+
+        return self.solution()
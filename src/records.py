@@ -0,0 +1,88 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import os, numpy as np
+
+class Records(object):
+
+    '''
+    Columnar store of many trajectories, each a sequence of states and
+    times with one control fewer, concatenated into single arrays and
+    delimited by offsets. Saved as a directory of .npy files, which load
+    memory-mapped so that trajectories are read only when accessed, or
+    as one .npz archive.
+    '''
+
+    keys = ('states', 'times', 'controls', 'offsets', 'coffsets')
+
+    def __init__(self, states, times, controls, offsets, coffsets):
+
+        # concatenated records
+        self.states = states
+        self.times = times
+        self.controls = controls
+
+        # start of each trajectory's states and times, and of its controls
+        self.offsets = offsets
+        self.coffsets = coffsets
+
+    @classmethod
+    def from_lists(cls, states, times, controls):
+
+        # lengths of each trajectory's records
+        n = np.array([len(s) for s in states], int)
+        m = np.array([len(u) for u in controls], int)
+
+        # concatenate, keeping the state dimension of empty sets
+        sdim = np.shape(states[0])[-1] if len(states) > 0 else 0
+        return cls(
+            np.concatenate([np.reshape(s, (-1, sdim)) for s in states]) if len(states) > 0 else np.empty((0, sdim)),
+            np.concatenate([np.ravel(t) for t in times]) if len(times) > 0 else np.empty(0),
+            np.concatenate([np.ravel(u) for u in controls]) if len(controls) > 0 else np.empty(0),
+            np.hstack((0, np.cumsum(n))),
+            np.hstack((0, np.cumsum(m)))
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+
+        # views of trajectory i's states, times, and controls
+        a, b = self.offsets[i], self.offsets[i + 1]
+        c, d = self.coffsets[i], self.coffsets[i + 1]
+        return self.states[a:b], self.times[a:b], self.controls[c:d]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def finals(self):
+
+        # final state of each trajectory, without touching the rest
+        return self.states[self.offsets[1:] - 1]
+
+    def save(self, path):
+
+        # single archive
+        path = os.fspath(path)
+        if path.endswith('.npz'):
+            np.savez(path, **{key: getattr(self, key) for key in self.keys})
+
+        # or raw arrays that can be memory-mapped
+        else:
+            os.makedirs(path, exist_ok=True)
+            for key in self.keys:
+                np.save(os.path.join(path, key + '.npy'), np.asarray(getattr(self, key)))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+
+        # archive members are read as whole arrays
+        path = os.fspath(path)
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                return cls(*[data[key] for key in cls.keys])
+
+        # raw arrays are mapped without copying
+        else:
+            return cls(*[np.load(os.path.join(path, key + '.npy'), mmap_mode=mmap_mode) for key in cls.keys])
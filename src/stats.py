@@ -0,0 +1,102 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import time, numpy as np
+
+class Stats(object):
+
+    '''
+    Opt-in call counters and timers. Methods are instrumented by shadowing
+    them with timed wrappers on their instances, and restored by removing
+    the wrappers, so nothing is paid while instrumentation is off. Times
+    are inclusive, so a phase's time contains that of any phase called
+    within it. Calls and elements count one per call unless given
+    functions of the call's arguments, for methods doing the work of
+    several calls at once. Counts are per wrapped instance, so a phase of
+    an object shared by several owners counts calls made through any of
+    them. Wrappers of the same method by several Stats stack, and each can
+    be removed in any order without disturbing the others.
+    '''
+
+    def __init__(self):
+
+        # wrapped (instance, method name, previous instance attribute)
+        self._wrapped = list()
+
+        # counters and timers per phase
+        self.reset()
+
+    def reset(self):
+
+        # calls, elements processed, and seconds per phase
+        self.calls = dict()
+        self.sizes = dict()
+        self.times = dict()
+
+    @property
+    def enabled(self):
+        return len(self._wrapped) > 0
+
+    def wrap(self, obj, name, phase, size=None, calls=None):
+
+        # method to time, and anything already shadowing it
+        fun = getattr(obj, name)
+        for d in (self.calls, self.sizes, self.times):
+            d.setdefault(phase, 0)
+
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            res = wrapper.fun(*args, **kwargs)
+            self.times[phase] += time.perf_counter() - t0
+            self.calls[phase] += 1 if calls is None else calls(*args, **kwargs)
+            self.sizes[phase] += 1 if size is None else size(*args, **kwargs)
+            return res
+
+        # wrapped method, and the instance attribute to restore
+        wrapper.fun = fun
+        wrapper.prev = obj.__dict__.get(name)
+
+        setattr(obj, name, wrapper)
+        self._wrapped.append((obj, name, wrapper))
+
+    def unwrap(self):
+
+        # remove wrappers, most recent first
+        for obj, name, wrapper in reversed(self._wrapped):
+
+            # on top, restoring what it shadowed
+            node = obj.__dict__.get(name)
+            if node is wrapper:
+                if wrapper.prev is None:
+                    delattr(obj, name)
+                else:
+                    setattr(obj, name, wrapper.prev)
+                continue
+
+            # or beneath other wrappers, unlinking it from the one wrapping it
+            while node is not None and getattr(node, 'prev', None) is not wrapper:
+                node = getattr(node, 'prev', None)
+            if node is not None:
+                node.fun, node.prev = wrapper.fun, wrapper.prev
+
+        self._wrapped = list()
+
+    def snapshot(self):
+
+        # copy of the counters and timers per phase
+        return {
+            phase: dict(calls=self.calls[phase], size=self.sizes[phase], time=self.times[phase])
+            for phase in self.calls
+        }
+
+def points(pts, *args, **kwargs):
+    return np.size(pts)//2
+
+def segments(segs, *args, **kwargs):
+    return np.size(segs)//4
+
+def arcs(arcs, *args, **kwargs):
+    return np.size(arcs)//5
+
+def samples(t, y, times, *args, **kwargs):
+    return len(times)
@@ -2,6 +2,7 @@
 # sprague@kth.se
 
 import numpy as np
+from . import backend
 
 # check if three points are on same line
 def onseg(p, q, r):
@@ -47,6 +48,10 @@ def orientation(p, q, r):
 # test intersection
 def intersection(seg0, seg1):
 
+    # compiled test if selected
+    if backend.active():
+        return bool(backend.intersection(np.asarray(seg0, float), np.asarray(seg1, float)))
+
     # extract points
     p0 = seg0[0, :]
     q0 = seg0[1, :]
@@ -83,29 +88,194 @@ def intersection_point(seg1, seg2):
     x3, y3 = seg2[0, :]
     x4, y4 = seg2[1, :]
 
+    # determinants, expanded
+    d1  = x1*y2 - y1*x2
+    d3  = x3*y4 - y3*x4
+    den = (x1 - x2)*(y3 - y4) - (y1 - y2)*(x3 - x4)
+
     # x
-    d1  = np.linalg.det([[x1, y1], [x2, y2]])
-    d2  = np.linalg.det([[x1, 1], [x2, 1]])
-    d3  = np.linalg.det([[x3, y3], [x4, y4]])
-    d4  = np.linalg.det([[x3, 1], [x4, 1]])
-    d5  = np.linalg.det([[x1, 1], [x2, 1]])
-    d6  = np.linalg.det([[y1, 1], [y2, 1]])
-    d7  = np.linalg.det([[x3, 1], [x4, 1]])
-    d8  = np.linalg.det([[y3, 1], [y4, 1]])
-    num = np.linalg.det([[d1, d2], [d3, d4]])
-    den = np.linalg.det([[d5, d6], [d7, d8]])
-    x   = num/den
+    x = (d1*(x3 - x4) - (x1 - x2)*d3)/den
 
     # y - shares some determinants
-    d2  = np.linalg.det([[y1, 1], [y2, 1]])
-    d4  = np.linalg.det([[y3, 1], [y4, 1]])
-    num = np.linalg.det([[d1, d2], [d3, d4]])
-    y = num/den
+    y = (d1*(y3 - y4) - (y1 - y2)*d3)/den
 
     # return intersection point
     return np.array([x, y], float)
 
+# orientation of triplets, broadcast over leading dimensions
+def orientations(p, q, r):
+
+    # orientation
+    val = (q[..., 1] - p[..., 1])*(r[..., 0] - q[..., 0]) - (q[..., 0] - p[..., 0])*(r[..., 1] - q[..., 1])
+
+    # colinear 0, clockwise 1, counterclockwise 2
+    return np.where(val == 0, 0, np.where(val > 0, 1, 2))
+
+# check if q lies within the bounding box of p and r
+def onsegs(p, q, r):
+    return (
+        (q[..., 0] <= np.maximum(p[..., 0], r[..., 0])) &
+        (q[..., 0] >= np.minimum(p[..., 0], r[..., 0])) &
+        (q[..., 1] <= np.maximum(p[..., 1], r[..., 1])) &
+        (q[..., 1] >= np.minimum(p[..., 1], r[..., 1]))
+    )
+
+# test intersection of (..., 2, 2) segment stacks, broadcast over leading dimensions
+def intersections(segs0, segs1):
+
+    # extract points
+    p0, q0 = segs0[..., 0, :], segs0[..., 1, :]
+    p1, q1 = segs1[..., 0, :], segs1[..., 1, :]
+
+    # orientations
+    o0 = orientations(p0, q0, p1)
+    o1 = orientations(p0, q0, q1)
+    o2 = orientations(p1, q1, p0)
+    o3 = orientations(p1, q1, q0)
+
+    # general intersection
+    res = (o0 != o1) & (o2 != o3)
+
+    # special colinear cases
+    res |= (o0 == 0) & onsegs(p0, p1, q0)
+    res |= (o1 == 0) & onsegs(p0, q1, q0)
+    res |= (o2 == 0) & onsegs(p1, p0, q1)
+    res |= (o3 == 0) & onsegs(p1, q0, q1)
+
+    return res
+
+# intersection points of the lines through (..., 2, 2) segment stacks, broadcast over leading dimensions
+def intersection_points(segs0, segs1):
+
+    # extract points
+    x1, y1 = segs0[..., 0, 0], segs0[..., 0, 1]
+    x2, y2 = segs0[..., 1, 0], segs0[..., 1, 1]
+    x3, y3 = segs1[..., 0, 0], segs1[..., 0, 1]
+    x4, y4 = segs1[..., 1, 0], segs1[..., 1, 1]
+
+    # determinants of intersection_point in closed form
+    d1, d3 = x1*y2 - y1*x2, x3*y4 - y3*x4
+    den = (x1 - x2)*(y3 - y4) - (y1 - y2)*(x3 - x4)
+
+    # nan or inf for parallel lines
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (d1*(x3 - x4) - (x1 - x2)*d3)/den
+        y = (d1*(y3 - y4) - (y1 - y2)*d3)/den
+
+    return np.stack((x, y), axis=-1)
+
+# intersection mask (n, m) and points (n, m, 2) of every pair from (n, 2, 2) and (m, 2, 2) segments
+def pairwise(segs0, segs1):
+
+    # all pairs
+    segs0, segs1 = np.asarray(segs0, float)[:, None], np.asarray(segs1, float)[None]
+    mask = intersections(segs0, segs1)
+
+    # points of crossing lines, nan where not intersecting
+    pts = intersection_points(segs0, segs1)
+    pts[~mask] = np.nan
+
+    # colinear overlaps meet along a stretch, so take an endpoint on the other segment
+    p0, q0 = segs0[..., 0, :], segs0[..., 1, :]
+    p1, q1 = segs1[..., 0, :], segs1[..., 1, :]
+    para = mask & ~np.isfinite(pts).all(axis=-1)
+    for p, a, b in ((p1, p0, q0), (q1, p0, q0), (p0, p1, q1), (q0, p1, q1)):
+        on = para & (orientations(a, b, p) == 0) & onsegs(a, p, b)
+        pts[on] = np.broadcast_to(p, pts.shape)[on]
+        para &= ~on
+
+    return mask, pts
+
+# test if horizontal rays from (..., 2) points cross (..., 2, 2) polygon edges
+def crossings(pts, edges):
+
+    # extract points and edges
+    x, y = pts[..., 0], pts[..., 1]
+    x0, y0 = edges[..., 0, 0], edges[..., 0, 1]
+    x1, y1 = edges[..., 1, 0], edges[..., 1, 1]
+
+    # ray crossings, as in Obstacle.point_inside
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xints = (y - y0)*(x1 - x0)/(y1 - y0) + x0
+    return (
+        (y > np.minimum(y0, y1)) &
+        (y <= np.maximum(y0, y1)) &
+        (x <= np.maximum(x0, x1)) &
+        ((x0 == x1) | (x <= xints))
+    )
+
+# distances from (..., 2) points to (..., 2, 2) segments
+def distances(pts, segs):
+
+    # extract segment points
+    p, q = segs[..., 0, :], segs[..., 1, :]
+
+    # projection parameter, clipped to the segment
+    d = q - p
+    dd = d[..., 0]**2 + d[..., 1]**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = ((pts - p)*d).sum(axis=-1)/dd
+    t = np.clip(np.where(dd > 0, t, 0), 0, 1)
+
+    # distance to closest point
+    r = p + t[..., None]*d - pts
+    return np.sqrt(r[..., 0]**2 + r[..., 1]**2)
+
+# test intersection of (..., 5) circular arcs, given as start pose (x, y, theta),
+# curvature and length, against (..., 2, 2) segments, broadcast over leading dimensions
+def arc_intersections(arcs, segs):
+
+    # extract arcs
+    x, y, theta, k, s = np.moveaxis(arcs, -1, 0)
+
+    # nearly straight arcs are tested as their chords
+    straight = np.abs(k*s) < 1e-9
+    chord = np.stack((
+        np.stack((x, y), axis=-1),
+        np.stack((x + s*np.cos(theta), y + s*np.sin(theta)), axis=-1)
+    ), axis=-2)
+    res = straight & intersections(chord, segs)
+
+    # circle centre, radius and swept angle of curved arcs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = np.where(straight, 1, 1/k)
+    cx, cy = x - R*np.sin(theta), y + R*np.cos(theta)
+    phi0 = np.arctan2(y - cy, x - cx)
+    sweep = np.abs(k*s)
+
+    # intersections of the segment's line with the circle
+    ax, ay = segs[..., 0, 0], segs[..., 0, 1]
+    dx, dy = segs[..., 1, 0] - ax, segs[..., 1, 1] - ay
+    fx, fy = ax - cx, ay - cy
+    A = dx**2 + dy**2
+    B = 2*(fx*dx + fy*dy)
+    C = fx**2 + fy**2 - R**2
+    disc = B**2 - 4*A*C
+
+    for sign in (-1, 1):
+
+        # parameter along the segment
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (-B + sign*np.sqrt(np.maximum(disc, 0)))/(2*A)
+        on = (disc >= 0) & (A > 0) & (t >= 0) & (t <= 1)
+
+        # angle swept from the start of the arc to the intersection
+        phi = np.arctan2(fy + t*dy, fx + t*dx)
+        rel = np.mod((phi - phi0)*np.sign(k), 2*np.pi)
+        on &= (rel <= sweep + 1e-12) | (rel >= 2*np.pi - 1e-12)
+
+        res |= ~straight & on
+
+    return res
+
+# concatenated ranges [start, start + count) for arrays of starts and counts
+def ranges(starts, counts):
+
+    # offset of each range in the output
+    offs = np.cumsum(counts) - counts
 
+    # index within each range plus its start
+    return np.arange(np.sum(counts)) - np.repeat(offs - starts, counts)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,76 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+from dubins import paths, util
+from dubins.environment import Environment
+
+def arcs(rng, n, lo=(0, 0), hi=(10, 10)):
+
+    # random starts, curvatures of either sign with straight and nearly straight ones,
+    # and lengths up to several full turns
+    k = rng.choice([-2, -0.5, 0.5, 2], n)*rng.uniform(0.5, 1, n)
+    k[:n//8] = 0
+    k[n//8:n//4] *= 10.0**rng.uniform(-12, -5, n//4 - n//8)
+    s = np.where(rng.random(n) < 0.25, rng.uniform(2*np.pi, 6*np.pi, n)/np.maximum(np.abs(k), 1e-9), rng.uniform(0.1, 8, n))
+    s = np.where(np.abs(k) < 0.1, rng.uniform(0.1, 8, n), s)
+    return np.column_stack((rng.uniform(lo, hi, (n, 2)), rng.uniform(-np.pi, np.pi, n), k, s))
+
+def chords(arcs, m=4000):
+
+    # densely sampled chords along each arc, of shape (n, m - 1, 2, 2)
+    q = paths.arc(arcs[:, None, :3], arcs[:, 3:4], arcs[:, 4:5]*np.linspace(0, 1, m))[..., :2]
+    return np.stack((q[:, :-1], q[:, 1:]), axis=2)
+
+def grazing(arcs, segs, c, tol=1e-6):
+
+    # tangent to the arc's circle, or an endpoint of either on the other, where sampling may disagree
+    x, y, theta, k, s = arcs.T
+    a, b = segs[:, 0], segs[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = 1/k
+        cx, cy = x - R*np.sin(theta), y + R*np.cos(theta)
+        d = b - a
+        line = np.abs(d[:, 0]*(cy - a[:, 1]) - d[:, 1]*(cx - a[:, 0]))/np.hypot(d[:, 0], d[:, 1])
+        tangent = np.abs(line - np.abs(R)) < tol*np.maximum(1, np.abs(R))
+    ends = np.minimum(util.distances(a[:, None], c).min(axis=1), util.distances(b[:, None], c).min(axis=1)) < tol
+    ends |= np.minimum(util.distances(c[:, 0, 0], segs), util.distances(c[:, -1, 1], segs)) < tol
+    return tangent | ends
+
+def test_arc_intersections():
+
+    # random arcs against random segments near them
+    rng = np.random.default_rng(0)
+    a = arcs(rng, 2000)
+    p = a[:, :2] + rng.uniform(-4, 4, (len(a), 2))
+    segs = np.stack((p, p + rng.normal(0, 3, p.shape)), axis=1)
+
+    # exact tests against the sampled chords, away from grazing contacts
+    c = chords(a)
+    ref = util.intersections(c, segs[:, None]).any(axis=1)
+    res = util.arc_intersections(a, segs)
+    bad = np.flatnonzero(res != ref)
+    assert grazing(a[bad], segs[bad], c[bad]).all()
+
+    # both outcomes, on every kind of arc
+    for kind in (a[:, 3] == 0, (a[:, 3] != 0) & (np.abs(a[:, 3]) < 1e-4), np.abs(a[:, 3]*a[:, 4]) > 2*np.pi):
+        assert ref[kind].any() and not ref[kind].all()
+
+def test_safe_arcs():
+
+    # random arcs over the map, some leaving it
+    env = Environment(50, 30, 1, 20, seed=0)
+    rng = np.random.default_rng(1)
+    a = arcs(rng, 400, (-1, -1), (env.lx + 1, env.ly + 1))
+
+    # against the exact segment checks of sampled chords
+    c = chords(a)
+    ref = env.safe_segments(c.reshape(-1, 2, 2)).reshape(c.shape[:2]).all(axis=1)
+    edges = np.concatenate((env._bedges, env.obset.ledges))
+    res = env.safe_arcs(a)
+    for i in np.flatnonzero(res != ref):
+        assert grazing(np.repeat(a[i:i + 1], len(edges), 0), edges, np.repeat(c[i:i + 1], len(edges), 0)).any()
+    assert res.any() and not res.all()
+
+    # and exactly as testing every edge
+    assert (res == ~util.arc_intersections(a[:, None], edges[None]).any(axis=1)).all()
@@ -0,0 +1,129 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins import backend, util
+from dubins.environment import Environment
+from dubins.dynamics import Dynamics, Dynamics_2nd
+from dubins.mission import Mission
+from dubins.optimal import Shooting
+
+# parity of the compiled kernels against the NumPy code paths
+pytestmark = pytest.mark.skipif(not backend.NUMBA, reason='numba is not installed')
+
+@pytest.fixture
+def both():
+
+    def run(fun):
+
+        # result under each backend, checking the selection took effect
+        res = dict()
+        for name in ('python', 'numba'):
+            backend.use(name)
+            assert backend.active() == (name == 'numba')
+            if name == 'numba':
+                assert hasattr(backend.point_inside, 'py_func')
+            res[name] = fun()
+        return res['python'], res['numba']
+
+    # restore the default selection
+    default = backend.use()
+    yield run
+    backend.use(default)
+
+@pytest.fixture
+def env():
+    return Environment(50, 30, 1, 20, seed=0)
+
+def test_point_inside(both, env):
+
+    # random points, vertices, and edge midpoints
+    rng = np.random.default_rng(0)
+    pts = np.vstack((
+        rng.uniform([0, 0], [env.lx, env.ly], (500, 2)),
+        env.obset.verts,
+        (env.obset.pedges[:, 0] + env.obset.pedges[:, 1])/2
+    ))
+    a, b = both(lambda: np.array([[ob.point_inside(p) for ob in env.obs] for p in pts]))
+    assert (a == b).all()
+
+def test_intersection(both):
+
+    # segments on an integer lattice, with many colinear and touching cases
+    segs = np.random.default_rng(0).integers(0, 8, (100, 2, 2)).astype(float)
+    a, b = both(lambda: np.array([[util.intersection(s, t) for t in segs] for s in segs]))
+    assert (a == b).all()
+
+def test_line_intersect(both, env):
+
+    rng = np.random.default_rng(0)
+    pts = rng.uniform([0, 0], [env.lx, env.ly], (300, 2))
+    segs = np.stack((pts, pts + rng.normal(0, 2, pts.shape)), axis=1)
+    a, b = both(lambda: np.array([[ob.line_intersect(s) for ob in env.obs] for s in segs]))
+    assert (a == b).all()
+
+def test_rk4(both, env):
+
+    # one rollout stepwise, and many in a batch
+    mission = Mission(Dynamics(1, 1), env, integrator='rk4')
+    a, b = both(lambda: mission.step(lambda t, s: 0.1*np.sin(t), Dt=10.0)[0])
+    assert np.allclose(a, b, rtol=0, atol=1e-9)
+
+    u = np.random.default_rng(0).uniform(-0.3, 0.3, (50, 10))
+    times = np.linspace(0, 40, 11)
+    a, b = both(lambda: mission.simulate_batch(u, times))
+    assert np.allclose(a, b, rtol=0, atol=1e-9)
+
+def test_safe_points(both, env):
+
+    # random points, some outside, with vertices and edge midpoints, through the batch and scalar queries
+    rng = np.random.default_rng(0)
+    pts = np.vstack((
+        rng.uniform([-1, -1], [env.lx + 1, env.ly + 1], (2000, 2)),
+        env.obset.verts,
+        (env.obset.pedges[:, 0] + env.obset.pedges[:, 1])/2,
+        env.perim
+    ))
+    a, b = both(lambda: env.safe_points(pts))
+    assert (a == b).all()
+    a, b = both(lambda: [env.safe(p) for p in pts[::7]])
+    assert a == b
+
+def test_safe_segments(both, env):
+
+    # random segments, with segments along and from obstacle edges and along the borders
+    rng = np.random.default_rng(0)
+    pts = rng.uniform([-1, -1], [env.lx + 1, env.ly + 1], (2000, 2))
+    e = env.obset.ledges
+    segs = np.concatenate((
+        np.stack((pts, pts + rng.normal(0, 2, pts.shape)), axis=1),
+        np.stack((e[:, 0], e[:, 0] + rng.normal(0, 1, (len(e), 2))), axis=1),
+        e,
+        env._bedges,
+        np.stack((pts, pts), axis=1)
+    ))
+    a, b = both(lambda: env.safe_segments(segs))
+    assert (a == b).all()
+    a, b = both(lambda: [env.safe(s) for s in segs[::7]])
+    assert a == b
+
+def test_eom_state(both):
+
+    # single states, as scipy's solvers pass them, and batches
+    dyn = Dynamics(1, 2)
+    s = np.random.default_rng(0).normal(size=(3, 20))
+    for state in (s[:, 0], s[:, :1], s):
+        a, b = both(lambda: dyn.eom_state(state, 0.3))
+        assert a.shape == b.shape == state.shape
+        assert np.allclose(a, b, rtol=1e-15, atol=0)
+
+def test_shoot(both):
+
+    # fullstates, transition matrices, and costs from random costates, saturated or not
+    mission = Mission(Dynamics_2nd(1), Environment(50, 30, 1, 0, seed=0), integrator='rk4')
+    sh = Shooting(mission)
+    lam = sh.guesses(20, seed=0)
+    a, b = both(lambda: sh.propagate(lam, 11))
+    for x, y in zip(a, b):
+        assert x.shape == y.shape
+        assert np.allclose(x, y, rtol=1e-10, atol=1e-12)
@@ -0,0 +1,70 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np
+from dubins.cache import LRU
+from dubins.environment import Environment
+
+class Counter(object):
+
+    # row sums, recording each batch computed
+    def __init__(self):
+        self.batches = list()
+
+    def __call__(self, rows):
+        self.batches.append(len(rows))
+        return rows.sum(axis=1)
+
+def test_eviction():
+
+    # the least recently used entry goes beyond size
+    lru, f = LRU(size=3), Counter()
+    rows = np.arange(8.0).reshape(4, 2)
+    lru.lookup('a', rows[:3], f)
+    lru.lookup('a', rows[:1], f)
+    lru.lookup('a', rows[3:], f)
+    assert len(lru) == 3
+
+    # so the first row, refreshed, stays, and the second is recomputed
+    lru.lookup('a', rows[:1], f)
+    lru.lookup('a', rows[1:2], f)
+    assert f.batches == [3, 1, 1]
+
+def test_counters():
+
+    # misses computed in one batch, hits from the memo, per tag
+    lru, f = LRU(), Counter()
+    rows = np.arange(6.0).reshape(3, 2)
+    assert (lru.lookup('a', rows, f) == [1, 5, 9]).all()
+    assert (lru.lookup('a', rows[::-1], f) == [9, 5, 1]).all()
+    assert (lru.lookup('b', rows[:2], f) == [1, 5]).all()
+    assert f.batches == [3, 2]
+    assert lru.info() == dict(hits=3, misses=5, size=5, maxsize=65536)
+
+    # clearing drops entries but keeps counters
+    lru.clear()
+    assert len(lru) == 0 and lru.hits == 3 and lru.misses == 5
+
+def test_quantised_keys():
+
+    # rows within the quantum share the first one's result
+    lru, f = LRU(quantum=1e-3), Counter()
+    rows = np.array([[1.0, 2.0], [1.0002, 2.0], [1.0, 2.002]])
+    assert (lru.lookup('a', rows, f) == [3, 3, 3.002]).all()
+    assert f.batches == [2] and lru.hits == 1
+    assert (lru.lookup('a', rows[1:2] - 0.0004, f) == [3]).all()
+    assert f.batches == [2] and lru.hits == 2
+
+def test_cleared_on_gen_obs():
+
+    # memoised queries follow new obstacles
+    env = Environment(50, 30, 1, 20, seed=0)
+    cache = env.memoize()
+    pts = np.random.default_rng(0).uniform([0, 0], [env.lx, env.ly], (2000, 2))
+    env.safe_points(pts)
+    assert len(cache) == len(pts)
+    env.gen_obs()
+    assert len(cache) == 0
+    res = env.safe_points(pts)
+    env.memoize(None)
+    assert (res == env.safe_points(pts)).all()
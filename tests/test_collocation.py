@@ -0,0 +1,50 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins.dynamics import Dynamics, Dynamics_2nd
+from dubins.environment import Environment
+from dubins.mission import Mission
+from dubins.collocation import Collocation
+
+def differences(fun, x, eps=1e-6):
+
+    # dense central difference Jacobian
+    return np.column_stack([
+        (fun(x + eps*e) - fun(x - eps*e))/(2*eps)
+        for e in np.eye(len(x))
+    ])
+
+@pytest.fixture(params=[Dynamics(1, 1), Dynamics(1, 2.0), Dynamics_2nd(1)], ids=['v1', 'v2', '2nd'])
+def problem(request):
+
+    # small problem about a perturbed straight line guess
+    env = Environment(50, 30, 1, 20, seed=3)
+    col = Collocation(Mission(request.param, env, integrator='rk4'), n=6)
+    x = col.guess()
+    return col, x + np.random.default_rng(0).normal(size=x.size)*0.01
+
+def test_jacobians(problem):
+
+    col, x = problem
+    assert np.allclose(col.defects_jac(x).toarray(), differences(col.defects, x), atol=1e-6)
+    assert np.allclose(col.clearance_jac(x).toarray(), differences(col.clearance, x), atol=1e-6)
+
+def test_hessians(problem):
+
+    # weighted Hessians against differences of the weighted Jacobians
+    col, x = problem
+    rng = np.random.default_rng(1)
+    v = rng.normal(size=col.defects(x).size)
+    H = differences(lambda x: col.defects_jac(x).T @ v, x)
+    assert np.allclose(col.defects_hess(x, v).toarray(), (H + H.T)/2, atol=1e-5)
+    H = differences(col.cost_grad, x)
+    assert np.allclose(col.cost_hess(x).toarray(), H, atol=1e-6)
+
+def test_solve():
+
+    # solution without obstacles in the way, validated by simulation
+    env = Environment(50, 30, 1, 0, seed=3)
+    mission = Mission(Dynamics(1, 2.0), env, integrator='rk4')
+    u, t = Collocation(mission, n=30).solve(maxiter=300)
+    assert mission.simulate(u, t) == 1
@@ -0,0 +1,74 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins import backend, util
+from dubins.environment import Environment
+
+@pytest.fixture
+def env():
+
+    # reference loops run as plain Python
+    default = backend.use()
+    backend.use('python')
+    yield Environment(50, 30, 1, 20, seed=0)
+    backend.use(default)
+
+def safe_point(env, p):
+
+    # check if within boundaries, then inside each obstacle, as the scalar loop did
+    if p[0] < 0 or p[0] > env.lx or p[1] < 0 or p[1] > env.ly:
+        return False
+    return not any(ob.point_inside(p) for ob in env.obs)
+
+def safe_segment(env, seg):
+
+    # check if intersecting boundaries, then each obstacle's edges, as the scalar loop did
+    if any(util.intersection(seg, env.perim[i:i + 2]) for i in range(4)):
+        return False
+    return not any(ob.line_intersect(seg) for ob in env.obs)
+
+def test_safe_points(env):
+
+    # random points, some outside, vertices, edge midpoints, and border points
+    rng = np.random.default_rng(0)
+    pts = np.vstack((
+        rng.uniform([-1, -1], [env.lx + 1, env.ly + 1], (2000, 2)),
+        env.obset.verts,
+        (env.obset.pedges[:, 0] + env.obset.pedges[:, 1])/2,
+        env.perim,
+        np.column_stack((rng.uniform(0, env.lx, 20), np.zeros(20)))
+    ))
+    ref = np.array([safe_point(env, p) for p in pts])
+    assert (env.safe_points(pts) == ref).all()
+    assert (env.safe_points(pts, fast=True) == ref).all()
+    assert [env.safe(p) for p in pts[::10]] == list(ref[::10])
+
+def test_safe_segments(env):
+
+    # random segments, segments from or along obstacle edges, and along or across borders
+    rng = np.random.default_rng(0)
+    pts = rng.uniform([-1, -1], [env.lx + 1, env.ly + 1], (1000, 2))
+    e = env.obset.ledges
+    segs = np.concatenate((
+        np.stack((pts, pts + rng.normal(0, 2, pts.shape)), axis=1),
+        np.stack((e[:, 0], e[:, 0] + rng.normal(0, 1, (len(e), 2))), axis=1),
+        e,
+        np.stack((e[:, 0], e[:, 1] + (e[:, 1] - e[:, 0])), axis=1),
+        np.stack((env.perim[:-1], env.perim[1:]), axis=1),
+        np.stack((env.perim[:-1]/2 + 1, env.perim[1:]/2 + 1), axis=1)
+    ))
+    ref = np.array([safe_segment(env, s) for s in segs])
+    assert (env.safe_segments(segs) == ref).all()
+    assert (env.safe_segments(segs, fast=True) == ref).all()
+    assert [env.safe(s) for s in segs[::10]] == list(ref[::10])
+
+@pytest.mark.parametrize('name', ['env', 'env.npz'])
+def test_save_load(env, tmp_path, name):
+
+    # round trip with or without the suffix, as strings or paths
+    for path in (tmp_path/name, str(tmp_path/name)):
+        env.save(path)
+        new = Environment.load(path)
+        assert (new.obset.verts == env.obset.verts).all()
+        assert (new.p0 == env.p0).all() and (new.pf == env.pf).all()
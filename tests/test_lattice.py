@@ -0,0 +1,26 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins import batch
+from dubins.dynamics import Dynamics
+from dubins.environment import Environment
+from dubins.lattice import Lattice
+from dubins.mission import Mission
+
+@pytest.mark.parametrize('seed', [2, 8])
+def test_plan_simulates(seed):
+
+    # plans reach the target under the default integrator, repeatably
+    mission = Mission(Dynamics(1, 1), Environment(50, 30, 1, 20, seed=seed))
+    sol = Lattice(mission).plan()
+    assert sol is not None
+    assert mission.simulate(*sol) == 1
+    assert mission.simulate(*sol) == 1
+
+def test_by_name():
+
+    # by name, as batch evaluation runs it, ignoring the seed
+    mission = Mission(Dynamics(1, 1), Environment(50, 30, 1, 20, seed=0), integrator='arc')
+    u, t = batch._plan('lattice', mission, 0, None)
+    assert mission.simulate(u, t) == 1
@@ -0,0 +1,34 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins.dynamics import Dynamics_2nd
+from dubins.environment import Environment
+from dubins.mission import Mission
+from dubins.optimal import Shooting
+
+@pytest.fixture
+def shooting():
+    return Shooting(Mission(Dynamics_2nd(1), Environment(50, 30, 1, 0, seed=0), integrator='rk4'))
+
+def test_rates(shooting):
+
+    # against the dense fullstate Jacobian, with saturated and free controls
+    dyn = shooting._dynamics
+    rng = np.random.default_rng(0)
+    z, P = rng.normal(size=(10, 50)), rng.normal(size=(10, 5, 50))
+    z[9] *= 3
+    f, g, L = shooting._rates(z, P)
+    u = dyn.pontryagin(z)
+    A = dyn.eom_fullstate_jac(z, np.clip(u, -1, 1))
+    A[4, 9] = np.where(np.abs(u) < 1, 1/(2*(dyn.alpha - 1)), 0)
+    assert np.allclose(f, dyn.eom_fullstate(z, np.clip(u, -1, 1)))
+    assert np.allclose(g, np.einsum('ijn,jkn->ikn', A, P))
+
+def test_solve(shooting):
+
+    # converges, and the controls reach the target
+    assert shooting.solve(seed=0) is not None
+    r, D, J = shooting.residuals(shooting.costate)
+    assert np.linalg.norm(r) <= 1e-6
+    assert shooting.mission.simulate(*shooting.solution()) == 1
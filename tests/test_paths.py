@@ -0,0 +1,60 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins import paths
+from dubins.dynamics import Dynamics
+from dubins.environment import Environment
+from dubins.mission import Mission
+
+def poses(rng, n, c=(0, 0), d=8):
+
+    # random poses within d of c
+    return np.column_stack((rng.uniform(-d, d, (n, 2)) + c, rng.uniform(-np.pi, np.pi, n)))
+
+def wrapped(a):
+    return np.angle(np.exp(1j*a))
+
+@pytest.mark.parametrize('r', [0.5, 1.0, 3.0])
+def test_words_reach(r):
+
+    # every feasible word ends on the goal pose
+    rng = np.random.default_rng(0)
+    q0, q1 = poses(rng, 200), poses(rng, 200)
+    L = paths.lengths(q0, q1, r)
+    for w in range(len(paths.words)):
+        ok = np.isfinite(L[:, w]).all(axis=1)
+        assert ok.sum() > 0
+        q = paths.state(q0[ok], w, L[ok, w], r, L[ok, w].sum(axis=1))[:, 0]
+        assert np.allclose(q[:, :2], q1[ok, :2], atol=1e-8)
+        assert np.allclose(wrapped(q[:, 2] - q1[ok, 2]), 0, atol=1e-8)
+
+    # the shortest one among them
+    word, Ls, total = paths.shortest(q0, q1, r)
+    assert np.allclose(total, np.nanmin(L.sum(axis=2), axis=1))
+
+def test_controls_simulate():
+
+    # open area, starting mid-way at heading 0
+    dyn = Dynamics(1, 1)
+    mission = Mission(dyn, Environment(50, 30, 1, 0, seed=0), integrator='arc')
+    mission.origin = np.array([25.0, 15.0])
+    rng = np.random.default_rng(0)
+    target = mission.target
+
+    for q1 in poses(rng, 20, mission.origin):
+
+        # shortest path to the goal pose as piecewise-constant controls
+        word, L, total = paths.shortest(np.hstack((mission.origin, 0)), q1, paths.radius(dyn))
+        u, t = paths.controls(word, L, dyn)
+        u, t = u[0], t[0]
+
+        # reaches the goal
+        mission.target = q1[:2]
+        assert mission.simulate(u, t) == 1
+
+        # and ends on its pose, with the goal out of the way
+        mission.target = target
+        mission.simulate(u, t)
+        assert np.allclose(mission.states[-1, :2], q1[:2], atol=1e-8)
+        assert np.isclose(wrapped(mission.states[-1, 2] - q1[2]), 0, atol=1e-8)
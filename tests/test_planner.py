@@ -0,0 +1,29 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins.dynamics import Dynamics
+from dubins.environment import Environment
+from dubins.mission import Mission
+from dubins.planner import RRT, RRTStar
+
+@pytest.mark.parametrize('planner, seed', [(RRT, 8), (RRT, 9), (RRTStar, 2), (RRTStar, 7)])
+def test_plans_simulate(planner, seed):
+
+    # plans reach the target under the default integrator, repeatably
+    mission = Mission(Dynamics(1, 1), Environment(50, 30, 1, 20, seed=seed))
+    sol = planner(mission, seed=seed).plan()
+    assert sol is not None
+    assert mission.simulate(*sol) == 1
+    assert mission.simulate(*sol) == 1
+
+def test_clear_paths():
+
+    # against exact distances, with some points skipped
+    env = Environment(50, 30, 1, 20, seed=0)
+    rng = np.random.default_rng(0)
+    pts = rng.uniform([0, 0], [env.lx, env.ly], (2000, 1, 2)) + np.cumsum(rng.normal(0, 0.05, (2000, 20, 2)), axis=1)
+    skip = rng.random((2000, 20)) < 0.05
+    d = env.distance(pts.reshape(-1, 2)).reshape(2000, 20)
+    for margin in (0.1, 0.3):
+        assert (env.clear_paths(pts, margin, skip) == ((d > margin) | skip).all(axis=1)).all()
@@ -0,0 +1,18 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins.records import Records
+
+@pytest.mark.parametrize('name', ['records.npz', 'records'])
+def test_save_load(tmp_path, name):
+
+    # archive or directory, as strings or paths
+    rng = np.random.default_rng(0)
+    rec = Records.from_lists([rng.normal(size=(n, 3)) for n in (3, 5)], [np.arange(3.0), np.arange(5.0)], [np.zeros(2), np.ones(4)])
+    for path in (tmp_path/name, str(tmp_path/name)):
+        rec.save(path)
+        new = Records.load(path)
+        assert len(new) == 2
+        for a, b in zip(new[1], rec[1]):
+            assert (np.asarray(a) == b).all()
@@ -0,0 +1,49 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins.dynamics import Dynamics, Dynamics_2nd
+from dubins.environment import Environment
+from dubins.mission import Mission
+
+@pytest.mark.parametrize('speed', [1.0, 2.0])
+def test_state_jac(speed):
+
+    # analytic state and control Jacobians against central differences over a batch
+    dyn = Dynamics(1, speed)
+    rng = np.random.default_rng(0)
+    s, u = rng.normal(size=(3, 4)), rng.uniform(-0.5, 0.5, 4)
+    A, B = dyn.eom_state_jac(s, u), dyn.eom_control_jac(s, u)
+    eps = 1e-6
+    for i in range(3):
+        e = np.zeros((3, 1))
+        e[i] = eps
+        fd = (dyn.eom_state(s + e, u) - dyn.eom_state(s - e, u))/(2*eps)
+        assert np.allclose(A[:, i], fd, atol=1e-7)
+    fd = (dyn.eom_state(s, u + eps) - dyn.eom_state(s, u - eps))/(2*eps)
+    assert np.allclose(B[:, 0], fd, atol=1e-7)
+
+@pytest.mark.parametrize('dyn', [Dynamics(1, 1), Dynamics(1, 2.0), Dynamics_2nd(1)])
+def test_sensitivity(dyn):
+
+    # final state Jacobian and clearance cost gradient against central differences
+    env = Environment(50, 30, 1, 20, seed=1)
+    mission = Mission(dyn, env, integrator='rk4', max_step=0.1)
+    rng = np.random.default_rng(0)
+    k = 8
+    times = np.linspace(0, 20, k + 1)
+    scale = 0.3 if dyn.sdim == 3 else 0.002
+    controls = rng.uniform(-scale, scale, (2, k))
+    sf, J, cost, grad = mission.sensitivity(controls, times, margin=2.0)
+
+    def differences(j, eps):
+        up, um = controls.copy(), controls.copy()
+        up[:, j] += eps
+        um[:, j] -= eps
+        a, b = mission.sensitivity(up, times, 2.0), mission.sensitivity(um, times, 2.0)
+        return (a[0] - b[0])/(2*eps), (a[2] - b[2])/(2*eps)
+
+    # the interpolated clearance is only piecewise smooth, so its cost is differenced more finely
+    for j in range(k):
+        assert np.allclose(J[:, :, j], differences(j, 1e-6)[0], rtol=1e-5, atol=1e-5*np.abs(J).max())
+        assert np.allclose(grad[:, j], differences(j, 1e-8)[1], rtol=1e-4, atol=1e-4*np.abs(grad).max())
@@ -0,0 +1,49 @@
+# Christopher Iliffe Sprague
+# sprague@kth.se
+
+import numpy as np, pytest
+from dubins import backend
+from dubins.dynamics import Dynamics
+from dubins.environment import Environment
+from dubins.mission import Mission
+
+def test_unwrap_out_of_order():
+
+    # two missions instrumenting one environment, finishing in either order
+    env = Environment(50, 30, 1, 20, seed=0)
+    for first in (0, 1):
+        a, b = Mission(Dynamics(1, 1), env, integrator='arc'), Mission(Dynamics(1, 1), env, integrator='arc')
+        a.instrument(True)
+        b.instrument(True)
+        (a, b)[first].instrument(False)
+        on, off = (a, b)[1 - first], (a, b)[first]
+
+        # only the instrumented mission's counters move
+        n, m = on.stats()['points']['calls'], off.stats()['points']['calls']
+        env.safe_points(np.zeros((3, 2)))
+        assert on.stats()['points']['calls'] == n + 1
+        assert off.stats()['points']['calls'] == m
+
+        # and removing the other leaves the environment as it was
+        on.instrument(False)
+        assert 'safe_points' not in vars(env)
+
+@pytest.mark.parametrize('name', ['python', 'numba'])
+def test_rk4_eom_calls(name):
+
+    # four right hand side evaluations per step, whether or not the compiled steps run them
+    if name == 'numba' and not backend.NUMBA:
+        pytest.skip('numba is not installed')
+    default = backend.use()
+    backend.use(name)
+    try:
+        mission = Mission(Dynamics(1, 1), Environment(50, 30, 1, 0, seed=0), integrator='rk4')
+        with mission.profile() as stats:
+            mission.simulate([0.1, -0.1], [0, 2, 4])
+            mission.simulate_batch(np.zeros((5, 2)), [0, 2, 4])
+        steps = 2*2/mission._max_step
+        eom = stats.snapshot()['eom']
+        assert eom['calls'] == 4*2*steps
+        assert eom['size'] == 4*steps + 4*5*steps
+    finally:
+        backend.use(default)